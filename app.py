@@ -1,14 +1,24 @@
 
 
-import pandas as pd
-from docxtpl import DocxTemplate
+from contextlib import ExitStack, contextmanager
 from datetime import date
-import streamlit as st
+from functools import partial
 import io
-import zipfile
+import json
+import math
+import os
+import streamlit as st
 import re
-import calendar
-from datetime import datetime
+# 这里只导入轻量的模块；pandas 在用到CSV名单时才加载（engine/excel/validation），
+# docxtpl 在点击 Generate 后的任务里才加载（template/render），页面冷启动不必等待
+from koc_generator import RenderCache, default_workers, prewarm_workers
+from koc_generator.checkpoint import Checkpoint, checkpoint_directory
+from koc_generator.history import DEFAULT_HISTORY_PATH, ContractHistory
+from koc_generator.inputs import InputCache, content_digest
+from koc_generator.precompute import Precomputer
+from koc_generator.records import DEFAULT_PAGE_SIZE, RecordStore
+from koc_generator.routing import ROUTE_COLUMNS, TemplateRouter
+from koc_generator.jobs import DONE, FAILED, RUNNING, STATUS_NAMES, JobManager
 
 st.set_page_config(page_title="Enhanced KOC Contract Generator", layout="wide", page_icon="📝")
 
@@ -166,6 +176,278 @@ def create_form_record(form_data):
     
     return record
 
+@st.cache_resource
+def get_job_manager():
+    """整个进程共用一个任务池，所有会话提交的任务都在这里运行"""
+    return JobManager()
+
+@st.cache_resource
+def get_precomputer():
+    """表单模式的后台预渲染线程，所有会话共用"""
+    return Precomputer()
+
+@st.cache_resource
+def get_input_cache():
+    """所有会话共用的解析结果缓存：同样的名单和模板只解析一次"""
+    return InputCache()
+
+@st.cache_resource
+def get_history():
+    """查询用的合同历史连接；生成任务各自打开一个实例写入"""
+    return ContractHistory(DEFAULT_HISTORY_PATH)
+
+@contextmanager
+def job_history(record_history, store_documents):
+    """生成任务的合同历史：每个任务一个实例，结束时提交并关闭"""
+    if not record_history:
+        yield None
+        return
+    with ContractHistory(DEFAULT_HISTORY_PATH, store_documents) as history:
+        yield history
+
+@contextmanager
+def job_checkpoint(resumable, *parts):
+    """断点续跑：按输入内容打开工作目录，生成成功后删除；失败或中断时保留，下次同样的输入接着生成
+
+    同样的输入同时生成时各用各的目录（见 Checkpoint.claim）。
+    """
+    if not resumable:
+        yield None
+        return
+    checkpoint = Checkpoint.claim(checkpoint_directory(*parts))
+    try:
+        yield checkpoint
+    except BaseException:
+        checkpoint.close()
+        raise
+    checkpoint.remove()
+
+DEFAULT_TEMPLATE_NAME = "默认模板"
+
+@contextmanager
+def job_template(input_cache, template_data, fast_path, routes):
+    """借出任务用的模板；routes 为 [(列名, 取值, 模板名, 模板字节)] 时返回按行选择模板的 TemplateRouter"""
+    with ExitStack() as stack:
+        template = stack.enter_context(input_cache.template(template_data, fast_path))
+        if not routes:
+            yield template
+            return
+        templates = {DEFAULT_TEMPLATE_NAME: template}
+        for _, _, name, data in routes:
+            if name not in templates:
+                templates[name] = stack.enter_context(input_cache.template(data, fast_path))
+        rules = [(column, value, name) for column, value, name, _ in routes]
+        yield TemplateRouter(templates, rules, DEFAULT_TEMPLATE_NAME, fast_path)
+
+def route_parts(routes):
+    """断点续跑工作目录的组成部分：规则和各模板的内容"""
+    parts = [json.dumps([route[:3] for route in routes], ensure_ascii=False).encode('utf-8')] if routes else []
+    return parts + [data for _, _, _, data in routes]
+
+def run_form_job(*, records, template_data, fast_path, generate_contracts, generate_summaries, output_mode, workers, render_cache, input_cache, on_invalid, resumable, summary_table, routes, record_history, store_documents, dedupe, report, on_progress):
+    """后台任务：表单记录生成"""
+    from koc_generator.engine import process_form_data
+
+    records_data = json.dumps(records, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    with job_template(input_cache, template_data, fast_path, routes) as template, job_checkpoint(resumable, records_data, template_data, *route_parts(routes)) as checkpoint, \
+            job_history(record_history, store_documents) as history:
+        return process_form_data(records, template, generate_contracts, generate_summaries, output_mode, workers,
+                                 render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table,
+                                 history=history, dedupe=dedupe)
+
+def run_roster_job(*, roster_data, roster_name, sheet_name, stream, template_data, fast_path, generate_contracts, generate_summaries, output_mode, workers, render_cache, input_cache, on_invalid, resumable, summary_table, routes, record_history, store_documents, dedupe, report, on_progress):
+    """后台任务：CSV/Excel名单生成（整份读取或分块流式读取）"""
+    from koc_generator.engine import process_data, process_roster_stream
+
+    with job_template(input_cache, template_data, fast_path, routes) as template, job_checkpoint(resumable, roster_data, template_data, str(sheet_name).encode('utf-8'), *route_parts(routes)) as checkpoint, \
+            job_history(record_history, store_documents) as history:
+        if stream:
+            roster = io.BytesIO(roster_data)
+            roster.name = roster_name
+            return process_roster_stream(roster, template, generate_contracts, generate_summaries, output_mode, workers,
+                                         sheet_name=sheet_name, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table,
+                                         history=history, dedupe=dedupe)
+        with report.stage('parse'):
+            df = input_cache.roster(roster_data, roster_name, sheet_name)
+        return process_data(df, template, generate_contracts, generate_summaries, output_mode, workers,
+                            render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table,
+                            history=history, dedupe=dedupe)
+
+def progress_text(progress):
+    """进度说明：已处理行数、速度、预计剩余时间"""
+    done = progress['done']
+    total = progress['total']
+    text = f"⏳ 已处理 {done}/{total} 行" if total else f"⏳ 已处理 {done} 行"
+    text += f" · {progress['rows_per_s']:.1f} 行/秒"
+    if progress['eta'] is not None and not progress['finished']:
+        text += f" · 预计剩余 {progress['eta']:.0f} 秒"
+    if progress['errors']:
+        text += f" · 失败 {progress['errors']} 行"
+    return text
+
+def precompute_records(store, template_data, fast_path):
+    """把当前模板下还没预渲染过的记录提交到后台；换模板后所有记录按新模板重新提交"""
+    digest = content_digest(template_data)
+    submitted = st.session_state.setdefault('precomputed_upto', {})
+    records = store.records_after(submitted.get(digest, 0))
+    if records:
+        get_precomputer().submit(records, template_data, RenderCache(), get_input_cache(), fast_path)
+        submitted[digest] = store.last_id
+    pending = get_precomputer().pending
+    if pending:
+        st.caption(f"⏳ 正在后台预渲染 {pending} 条记录的合同")
+    elif len(store):
+        st.caption("✅ 所有记录的合同已预渲染，生成时直接打包")
+
+def show_records(store):
+    """已添加的记录：可搜索、分页的表格，只显示当前页；勾选多行后一次删除"""
+    st.markdown("### 📋 已添加的记录")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("🔍 搜索", key="record_search", placeholder="姓名 / 邮箱 / 主平台昵称")
+    with col2:
+        page_size = st.selectbox("每页条数", [DEFAULT_PAGE_SIZE, 50, 100], key="record_page_size")
+    positions = store.search(query)
+    pages = max(1, math.ceil(len(positions) / page_size))
+    # 删除或搜索后总页数可能变少，先把当前页码收回到范围内
+    if st.session_state.get('record_page', 1) > pages:
+        st.session_state.record_page = pages
+    page = st.number_input(f"页码（共 {pages} 页）", min_value=1, max_value=pages, key="record_page") if pages > 1 else 1
+    table = store.page(positions, page, page_size)
+    selection = st.dataframe(table, hide_index=True, on_select="rerun", selection_mode="multi-row", key=f"record_table_{store.version}")
+    selected = [table['ID'][i] for i in selection.selection.rows]
+    if selected and st.button(f"❌ 删除选中的 {len(selected)} 条记录", key="delete_records_btn"):
+        store.delete(selected)
+        st.rerun()
+    summary = f"📊 当前共有 {len(store)} 条记录"
+    if query.strip():
+        summary += f"，搜索到 {len(positions)} 条"
+    st.success(summary)
+
+def show_validation(uploaded_csv, sheet_name):
+    """上传后立即整表校验名单，有问题的行在生成前一次性列出"""
+    from koc_generator.engine import select_roster_rows
+    from koc_generator.validation import validate_rows
+
+    try:
+        df = get_input_cache().roster(uploaded_csv.getvalue(), uploaded_csv.name, sheet_name)
+        rows, labels = select_roster_rows(df)
+    except Exception as e:
+        st.error(f"❌ 无法读取名单：{e}")
+        return
+    errors = validate_rows(rows, labels)
+    if errors.empty:
+        st.success(f"✅ 名单校验通过，共 {len(rows)} 行")
+        return
+    st.warning(f"⚠️ {errors['row'].nunique()} / {len(rows)} 行未通过校验：")
+    st.dataframe(errors.rename(columns={'row': '行号', 'label': '行', 'column': '列', 'error': '问题'}), hide_index=True)
+
+def show_row_errors(report):
+    """出错的行汇总成一张表，一次性显示"""
+    if report['error_rows']:
+        st.warning(f"⚠️ {report['errors']} 行处理失败，未生成对应文件：")
+        st.dataframe([{'行': item['label'], '错误': item['error']} for item in report['error_rows']], hide_index=True)
+
+def show_run_report(data):
+    """显示运行报告：总耗时、各阶段耗时与每行延迟、最慢的行"""
+    with st.expander("⏱️ 运行报告", expanded=False):
+        st.write(f"共处理 {data['rows']} 行，用时 {data['elapsed_s']:.2f} 秒（{data['rows_per_s']} 行/秒），出错 {data['errors']} 行")
+        if data['cache'] is not None:
+            st.write(f"♻️ 渲染缓存：命中 {data['cache']['hits']}，未命中 {data['cache']['misses']}")
+        if data.get('fast_path'):
+            st.write("⚡ 已使用快速渲染（含 &、< 等字符的行仍走 docxtpl）")
+        if data.get('resumed'):
+            st.write(f"⏯️ 断点续跑：{data['resumed']} 份合同取自上次中断前的进度")
+        if data.get('duplicate_rows'):
+            st.write(f"🧹 去重：跳过 {len(data['duplicate_rows'])} 行重复的记录（同一邮箱、姓名、平台账号、合同月份）")
+            st.dataframe([{'行': item['label'], '与之重复': item['duplicate_of']} for item in data['duplicate_rows']], hide_index=True)
+        if data.get('renamed'):
+            st.write(f"🏷️ {data['renamed']} 个文件与他人同名，已在文件名后加上区分后缀")
+        if data.get('templates'):
+            st.write("🔀 按行选择模板：" + "，".join(f"{name} {rows} 行" for name, rows in data['templates'].items()))
+        st.dataframe(data['stages'], hide_index=True)
+        if data['slowest_rows']:
+            st.caption("最慢的行")
+            st.dataframe(data['slowest_rows'], hide_index=True)
+        st.caption("报告已以 JSON 格式写入压缩包")
+
+def show_history():
+    """合同历史查询：按邮箱、姓名、平台账号、月份查找，保存了 .docx 的可以直接下载
+
+    只在点击“查询”时打开数据库并查询，结果保存在 session state 中；页面其他部分重新运行时不访问数据库。
+    """
+    with st.form("history_query"):
+        email_col, name_col, username_col, month_col = st.columns(4)
+        with email_col:
+            email = st.text_input("邮箱", key="history_email")
+        with name_col:
+            name = st.text_input("姓名（前缀）", key="history_name")
+        with username_col:
+            username = st.text_input("平台账号", key="history_username")
+        with month_col:
+            month = st.text_input("合同月份", key="history_month", placeholder="YYYY-MM")
+        submitted = st.form_submit_button("🔍 查询")
+    if submitted:
+        if not os.path.exists(DEFAULT_HISTORY_PATH):
+            # 还没有记录过合同时不创建数据库
+            st.session_state.history_rows = []
+        else:
+            st.session_state.history_rows = get_history().search(email, name, username, month)
+    rows = st.session_state.get('history_rows')
+    if rows is None:
+        return
+    st.caption(f"显示最近的 {len(rows)} 份合同" if rows else "没有符合条件的合同")
+    if not rows:
+        return
+    history = get_history()
+    columns = {'id': 'ID', 'created_at': '生成时间', 'month': '月份', 'name': '姓名', 'email': '邮箱', 'filename': '文件名', 'template_hash': '模板', 'has_document': '已保存文档'}
+    table = [{title: str(row[column])[:12] if column == 'template_hash' else row[column] for column, title in columns.items()} for row in rows]
+    event = st.dataframe(table, hide_index=True, on_select="rerun", selection_mode="single-row", key="history_table")
+    selected = [rows[i] for i in event.selection.rows]
+    if selected:
+        row = selected[0]
+        st.json(history.context(row['id']), expanded=False)
+        document = history.document(row['id']) if row['has_document'] else None
+        if document is not None:
+            st.download_button("📥 下载该合同", document[1], file_name=document[0], key=f"history_download_{row['id']}")
+
+def show_job(job):
+    """显示一个任务：进行中显示进度，完成后显示结果和下载按钮"""
+    st.markdown(f"**任务 `{job.id}`** · {job.title} · {STATUS_NAMES[job.status]} · 提交于 {job.created_at}")
+    if job.status == RUNNING and job.progress:
+        if job.progress['total']:
+            st.progress(min(1.0, job.progress['done'] / job.progress['total']))
+        st.text(progress_text(job.progress))
+    elif job.status == FAILED:
+        st.error(f"❌ Processing failed: {job.error}")
+    elif job.status == DONE:
+        st.success(f"📄 Generated {job.contracts} contract files · 📝 Generated {job.summaries} summary files")
+        show_row_errors(job.report)
+        show_run_report(job.report)
+        with get_job_manager().open_archive(job.id) as archive:
+            st.download_button(
+                "📥 Download All Files",
+                archive,
+                file_name=job.download_filename,
+                mime="application/zip",
+                key=f"download_{job.id}"
+            )
+
+def show_jobs(auto_refresh=False):
+    """本会话提交或查询过的任务，最新的在前；自动刷新时所有任务结束后重新运行整个页面"""
+    manager = get_job_manager()
+    active = False
+    for job_id in st.session_state.job_ids:
+        job = manager.get(job_id)
+        if job is None:
+            st.warning(f"⚠️ 找不到任务 {job_id}（可能已过期）")
+        else:
+            active = active or not job.finished
+            show_job(job)
+        st.divider()
+    if auto_refresh and not active:
+        st.rerun()
+
 # 输入方式选择
 st.markdown("### 📋 选择输入方式")
 input_mode = st.radio(
@@ -179,8 +461,8 @@ if input_mode == "📝 表单填写（推荐）":
     st.markdown("### 📝 表单填写模式")
     
     # 初始化session state
-    if 'form_records' not in st.session_state:
-        st.session_state.form_records = []
+    if 'form_store' not in st.session_state:
+        st.session_state.form_store = RecordStore()
     
     # 表单填写区域
     with st.expander("📋 填写KOC信息", expanded=True):
@@ -295,7 +577,7 @@ if input_mode == "📝 表单填写（推荐）":
                         'payment_info': payment_info
                     })
                     
-                    st.session_state.form_records.append(record)
+                    st.session_state.form_store.add(record)
                     st.success(f"✅ 已添加记录：{party_b_name}")
                     st.rerun()
         
@@ -304,31 +586,36 @@ if input_mode == "📝 表单填写（推荐）":
                 st.rerun()
     
     # 显示已添加的记录
-    if st.session_state.form_records:
-        st.markdown("### 📋 已添加的记录")
-        for i, record in enumerate(st.session_state.form_records):
-            with st.expander(f"📄 {record['Party B Name']} - {record.get('Main Platform nickname', '')}", expanded=False):
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.write(f"**邮箱**: {record['Email']}")
-                    st.write(f"**平台**: {record.get('platform_display', '')}")
-                    st.write(f"**视频金额**: ${record['Video Rate']}")
-                    st.write(f"**预计视频**: {record['Estimated Videos']}")
-                with col2:
-                    if st.button(f"❌ 删除", key=f"delete_{i}"):
-                        st.session_state.form_records.pop(i)
-                        st.rerun()
-        
-        st.success(f"📊 当前共有 {len(st.session_state.form_records)} 条记录")
+    if len(st.session_state.form_store):
+        show_records(st.session_state.form_store)
 
 # 模板上传（两种模式都需要）
 st.markdown("### 📄 上传Word模板")
 uploaded_template = st.file_uploader("📄 Upload Word Template (.docx)", type=["docx"])
+routes = []
+with st.expander("🔀 按行选择模板（可选）"):
+    st.caption("不同支付方式、奖励档位或履行状态的行使用不同模板，一次生成到同一个压缩包。规则按顺序匹配，都不匹配的行使用上面的模板")
+    route_templates = st.file_uploader("其他模板", type=["docx"], accept_multiple_files=True, key="route_templates")
+    for i, route_template in enumerate(route_templates or []):
+        column_col, value_col = st.columns(2)
+        with column_col:
+            route_column = st.selectbox(f"{route_template.name} 用于", list(ROUTE_COLUMNS), format_func=ROUTE_COLUMNS.get, key=f"route_column_{i}")
+        with value_col:
+            route_value = st.text_input("取值（不区分大小写）", key=f"route_value_{i}", placeholder="如 paypal、lower、已履行完毕")
+        if route_value.strip():
+            routes.append((route_column, route_value.strip(), route_template.name, route_template.getvalue()))
 
 # CSV上传界面（原有功能）
 if input_mode == "📄 CSV文件上传":
     st.markdown("### 📄 CSV文件上传模式")
-    uploaded_csv = st.file_uploader("📑 Upload CSV File", type=["csv"])
+    uploaded_csv = st.file_uploader("📑 Upload CSV / Excel File", type=["csv", "xlsx", "xls"])
+    sheet_name = None
+    from koc_generator.excel import is_excel
+    if uploaded_csv and is_excel(uploaded_csv.name):
+        sheet_name = st.selectbox("选择工作表", get_input_cache().sheet_names(uploaded_csv.getvalue(), uploaded_csv.name))
+    stream_csv = st.checkbox("分块流式读取（适合超大名单，边读边生成）", value=False)
+    if uploaded_csv and not stream_csv:
+        show_validation(uploaded_csv, sheet_name)
 
 # 生成选项
 st.markdown("### 生成选项")
@@ -337,6 +624,88 @@ generate_mode = st.radio(
     ["只批量生成合同（仅合同文件）", "合同及配对的基本内容（合同+概括配对输出）"],
     index=1
 )
+OUTPUT_MODE_OPTIONS = {
+    "配对输出（每份合同配一个概括文件）": "配对输出",
+    "单独文件（每人一个概括文件）": "单独文件",
+    "合并文件（全部概括写入一个文本文件）": "合并文件",
+}
+SUMMARY_TABLE_OPTIONS = {
+    "不导出": None,
+    "CSV": 'csv',
+    "Excel (.xlsx)": 'xlsx',
+    "JSON Lines (.jsonl)": 'jsonl',
+}
+output_mode = "配对输出"
+summary_table = None
+if generate_mode == "合同及配对的基本内容（合同+概括配对输出）":
+    output_mode = OUTPUT_MODE_OPTIONS[st.radio("概括输出方式", list(OUTPUT_MODE_OPTIONS), index=0)]
+    summary_table = SUMMARY_TABLE_OPTIONS[st.selectbox(
+        "概括汇总表",
+        list(SUMMARY_TABLE_OPTIONS),
+        index=0,
+        help="另外导出一张每行一条概括的表格（姓名、昵称、平台、金额、视频数、上线时间、奖励、付款条件），便于导入其他系统"
+    )]
+workers = st.number_input(
+    "并行进程数",
+    min_value=1,
+    max_value=default_workers(),
+    value=1,
+    help="大于1时使用多个进程并行渲染合同，适合大批量数据"
+)
+if workers > 1:
+    # 选择并行时就在后台准备好工作进程的依赖，点击 Generate 后不必再等待导入
+    prewarm_workers()
+use_render_cache = st.checkbox(
+    "使用渲染缓存（只重新生成有改动的合同）",
+    value=True,
+    help="模板和该行数据都没有变化的合同直接复用上次生成的文件"
+)
+fast_path = st.checkbox(
+    "快速渲染（模板只含简单变量时）",
+    value=True,
+    help="模板中只有 {{ 变量 }} 占位符时直接替换XML，结果与 docxtpl 相同；含循环、条件等语法的模板自动使用 docxtpl"
+)
+# 取值即 validation.SKIP_INVALID / STOP_INVALID（不在页面加载时导入 validation）
+INVALID_ROW_OPTIONS = {
+    "跳过无效行，其余照常生成": 'skip',
+    "有无效行时停止，不生成任何文件": 'stop',
+    "不校验": None,
+}
+on_invalid = INVALID_ROW_OPTIONS[st.radio(
+    "名单校验（必填项、邮箱、金额、日期、已履行完毕的上线数量）",
+    list(INVALID_ROW_OPTIONS),
+    index=0,
+    help="生成前先整表校验，在渲染任何合同之前处理有问题的行"
+)]
+eager = False
+if input_mode == "📝 表单填写（推荐）":
+    eager = st.checkbox(
+        "预渲染（添加记录后立即在后台生成合同）",
+        value=False,
+        help="上传模板后，每添加一条记录就在后台渲染它的合同并存入渲染缓存；点击生成时只需打包。修改记录或更换模板只重新渲染受影响的合同"
+    )
+    if eager and uploaded_template:
+        precompute_records(st.session_state.form_store, uploaded_template.getvalue(), fast_path)
+resumable = st.checkbox(
+    "断点续跑（边生成边保存进度）",
+    value=False,
+    help="适合大名单：服务器重启或任务中断后，用同样的名单和模板重新生成会跳过已完成的行"
+)
+dedupe = st.checkbox(
+    "渲染前去重",
+    value=True,
+    help="同一邮箱、姓名、平台账号、合同月份的重复行只生成一次；不同的人同名时，后出现的文件加上固定的后缀，解压时不会互相覆盖"
+)
+record_history = st.checkbox(
+    "记录到合同历史",
+    value=False,
+    help="把生成的每份合同（context、模板、文件名、内容哈希）记入本地数据库，可在页面底部按邮箱、姓名、账号、月份查询"
+)
+store_documents = record_history and st.checkbox(
+    "同时保存合同文件",
+    value=False,
+    help="在合同历史中保存 .docx，之后可以直接下载而不用重新生成"
+)
 
 # 生成按钮
 generate = st.button("🚀 Generate")
@@ -345,427 +714,87 @@ generate = st.button("🚀 Generate")
 if generate_mode == "只批量生成合同（仅合同文件）":
     generate_contracts = True
     generate_summaries = False
-    output_mode = "配对输出"
 else:
     generate_contracts = True
     generate_summaries = True
-    output_mode = "配对输出"
-
-def generate_contract_summary(row):
-    """生成合同基本内容概括 - 使用中文字段"""
-    try:
-        kol_name = str(row.get('Party B Name', '')).strip()
-        nickname = str(row.get('Main Platform nickname', '')).strip()
-        video_rate = str(row.get('Video Rate', '')).strip()
-        video_number = str(row.get('Estimated Videos', '')).strip()
-        statement = str(row.get('Statement', '')).strip()
-        actual_video_number = str(row.get('No. of Posted Videos', '')).strip()
-        bonus = str(row.get('Bonus', '')).strip().lower()
-
-        # 获取平台信息 - 从各个平台字段组合
-        platform_fields = infer_platform_fields(row)
-        platforms = platform_fields['platform']
-
-        # 获取日期信息 - 使用infer_chinese_date_versions函数（用于中文摘要）
-        date_fields = infer_chinese_date_versions(row)
-        promotion_date = date_fields['promotion_date']
-
-        # 获取支付信息
-        payment_method = str(row.get('Payment method', '')).strip()
-        if payment_method.lower() == 'bank':
-            payment_text = "银行转账，手续费共同承担，视频上线后 Net 30 days/video。"
-        elif payment_method.lower() == 'paypal':
-            payment_text = "PayPal转账，手续费对方承担，预先扣除2%，视频上线后 Net 30 days/video。"
-        else:
-            payment_text = "视频上线后 Net 30 days/video。"
-
-        try:
-            video_rate_clean = "{:.0f}".format(float(video_rate)) if video_rate else "0"
-        except:
-            video_rate_clean = video_rate
-
-        # 奖励机制：根据bonus字段判断
-        bonus_text = ""
-        if bonus in ['lower', 'higher']:
-            bonus_text = "\n3. 有奖励机制，合同中有根据播放量制定的详细奖励机制，具体参见合同。"
-
-        koc_display_name = nickname if nickname else kol_name
-
-        # 根据statement判断履行状态，选择不同的时间表述
-        if statement == "已履行完毕":
-            line2 = f"2. 单支视频金额${video_rate_clean}，签约 {video_number} 期视频，实际上线视频数量为 {actual_video_number} 支，视频上线时间为 {promotion_date}。"
-        else:
-            line2 = f"2. 单支视频金额${video_rate_clean}，签约 {video_number} 期视频，视频预计上线时间为 {promotion_date}。"
-        
-        summary = f'''合作事项：\n1. 海外KOC（{koc_display_name}），发布平台{platforms}。\n{line2}{bonus_text}\n\n权利义务：(重点highlight)\n1. 未经甲方同意，乙方不得删除视频，内容永久保留，否则支付甲方50%的费用。\n2. 乙方发布未经批准/错误版本视频，甲方可以选择补偿方式（删除重发、另行协商补偿、终止合作拒绝付款）。\n\n付款条件：\n{payment_text}'''
-        return summary
-    except Exception as e:
-        return f"生成概括时出错: {str(e)}"
-
-def infer_platform_fields(row):
-    platform_map = {
-        'TT': 'TikTok',
-        'IG': 'Instagram',
-        'YT': 'YouTube',
-        'FB': 'Facebook',
-        'kwai': 'Kwai'
-    }
-    username_map = {
-        'TT': 'Tiktok Video',
-        'IG': 'Instagram Reels',
-        'YT': 'YouTube Shorts',
-        'FB': 'Facebook Reels',
-        'kwai': 'Kwai Video'
-    }
-    link_map = {
-        'TT': 'https://www.tiktok.com/@{}',
-        'IG': 'https://www.instagram.com/{}',
-        'YT': 'https://www.youtube.com/@{}',
-        'FB': 'https://www.facebook.com/{}',
-        'kwai': 'https://www.kwai.com/user/{}'
-    }
-    platforms = []
-    usernames = []
-    links = []
-    for key in platform_map:
-        uname = str(row.get(key, '')).strip()
-        if uname:
-            platforms.append(platform_map[key])
-            usernames.append(f"{username_map[key]} - {uname}")
-            links.append(link_map[key].format(uname))
-    return {
-        'platform': ' ＆ '.join(platforms),
-        'platform_username': '\n'.join(usernames),
-        'Influencer_links': '\n'.join(links)
-    }
-
-def infer_date_versions(row):
-    start = row.get('Start date', '')
-    end = row.get('end date', '')
-    try:
-        start_dt = datetime.strptime(start, '%Y-%m-%d')
-        if end and str(end).strip():  # 检查end date是否为空
-            end_dt = datetime.strptime(end, '%Y-%m-%d')
-            if start_dt.year == end_dt.year and start_dt.month == end_dt.month:
-                english = f"{calendar.month_name[start_dt.month]} {start_dt.year}"
-            else:
-                english = f"{calendar.month_name[start_dt.month]} {start_dt.year} - {calendar.month_name[end_dt.month]} {end_dt.year}"
-        else:
-            # 如果end date为空，只显示开始日期
-            english = f"{calendar.month_name[start_dt.month]} {start_dt.year}"
-    except Exception as e:
-        print(f"Date parsing error: {e}, start: {start}, end: {end}")
-        english = ""
-    return {
-        'promotion_date': english
-    }
-
-def infer_chinese_date_versions(row):
-    start = row.get('Start date', '')
-    end = row.get('end date', '')
-    try:
-        start_dt = datetime.strptime(start, '%Y-%m-%d')
-        if end and str(end).strip():  # 检查end date是否为空
-            end_dt = datetime.strptime(end, '%Y-%m-%d')
-            if start_dt.year == end_dt.year and start_dt.month == end_dt.month:
-                chinese = f"{start_dt.year}年{start_dt.month:02d}月"
-            else:
-                chinese = f"{start_dt.year}年{start_dt.month:02d}月 - {end_dt.year}年{end_dt.month:02d}月"
-        else:
-            # 如果end date为空，只显示开始日期
-            chinese = f"{start_dt.year}年{start_dt.month:02d}月"
-    except Exception as e:
-        print(f"Date parsing error: {e}, start: {start}, end: {end}")
-        chinese = ""
-    return {
-        'promotion_date': chinese
-    }
-
-def infer_bonus_info(row):
-    bonus = str(row.get('Bonus', 'none')).strip().lower()
-    # 处理不同的bonus值格式
-    if bonus == 'lower':
-        return {
-            'bonus_info': """*The bonuses will be paid with basic video production fee.\n\nBonus Payment Policy:\n\n*One video will only get the bonus once in the limited time. Pay the bonus with the highest amount.\n\nBonus per video reaches 100k views in 3 days from the date of posting, USD[15.00].\nBonus per video reaches 200k views in 3 days from the date of posting, USD[20.00].\nBonus per video reaches 300k views in 3 days from the date of posting, USD[30.00].\nBonus per video reaches 500k views in 3 days from the date of posting, USD[45.00].\nBonus per video reaches 1M views in 3 days from the date of posting, USD[65.00].\n\nTotal Budget up to $1500."""
-        }
-    elif bonus == 'higher':
-        return {
-            'bonus_info': """*The bonuses will be paid with basic video production fee.\n\nBonus Payment Policy:\n\n*One video will only get the bonus once in the limited time. Pay the bonus with the highest amount.\n\nBonus per video reaches 100k views in 3 days from the date of posting, USD[30.00].\nBonus per video reaches 200k views in 3 days from the date of posting, USD[40.00].\nBonus per video reaches 300k views in 3 days from the date of posting, USD[60.00].\nBonus per video reaches 500k views in 3 days from the date of posting, USD[90.00].\nBonus per video reaches 1M views in 3 days from the date of posting, USD[110.00].\n\nTotal Budget up to $1500."""
-        }
-    else:
-        return {'bonus_info': ''}
-
-def infer_payment_fields(row):
-    method = str(row.get('Payment method', '')).strip().lower()
-    if method == 'bank':
-        return {
-            'payment_charges': "Payment charges shall be borne by each party independently (SHA)."
-        }
-    elif method == 'paypal':
-        return {
-            'payment_charges': "Party A processing fee with 2% of total payments shall be deducted in advance."
-        }
-    else:
-        return {
-            'payment_charges': ""
-        }
-
-def process_data(df, uploaded_template, generate_contracts, generate_summaries, output_mode):
-    today = date.today().isoformat()
-    zip_buffer = io.BytesIO()
-    summaries = []
-    contract_files = []
-    last_valid_index = df['Party B Name'].apply(lambda x: str(x).strip() != '').to_numpy().nonzero()[0]
-    if len(last_valid_index) > 0:
-        last_valid_index = last_valid_index[-1]
-    else:
-        last_valid_index = -1
-    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED) as zip_file:
-        for index, row in df.iloc[2:last_valid_index+1].iterrows():
-            name_value = row['Party B Name'] if 'Party B Name' in row else ''
-            if str(name_value).strip() == "":
-                continue
-            try:
-                safe_name = str(row['Party B Name']).replace(" ", "_").replace("/", "-")
-                if generate_contracts:
-                    template = DocxTemplate(uploaded_template)
-                    video_rate_value = row['Video Rate'] if 'Video Rate' in row else ''
-                    is_video_rate_empty = False
-                    try:
-                        is_video_rate_empty = bool(pd.isna(video_rate_value)) or str(video_rate_value).strip() == ""
-                    except Exception:
-                        is_video_rate_empty = str(video_rate_value).strip() == ""
-                    # 自动推断内容
-                    platform_fields = infer_platform_fields(row)
-                    date_fields = infer_date_versions(row)
-                    bonus_info = infer_bonus_info(row)
-                    payment_fields = infer_payment_fields(row)
-                    context = {
-                        'Influencer_name': row['Party B Name'],
-                        'Influencer_email': row['Email'],
-                        'Influencer_contact': "N/A" if pd.isna(row['Contact']) or str(row['Contact']).strip() == "" else row['Contact'],
-                        'Influencer_address': row['Address'],
-                        'platform': platform_fields['platform'],
-                        'platform_username': platform_fields['platform_username'],
-                        'Influencer_links': platform_fields['Influencer_links'],
-                        'promotion_date': date_fields['promotion_date'],
-                        'video_rate': "{:.2f}".format(float(video_rate_value)) if not is_video_rate_empty else "",
-                        'video_number': row['Estimated Videos'],
-                        'bonus_info': bonus_info['bonus_info'],
-                        'payment_method': row['Payment method'],
-                        'payment_information': row['Payment Info'],
-                        'payment_charges': payment_fields['payment_charges']
-                    }
-                    template.render(context)
-                    start_date = row.get('Start date', '')
-                    start_datetime = datetime.strptime(str(start_date).strip(), '%Y-%m-%d')
-                    contract_month = start_datetime.strftime('%Y-%m')
-                    contract_filename = f'FW-ARETIS & {name_value}_{contract_month}.docx'
-                    contract_files.append(contract_filename)
-                    doc_stream = io.BytesIO()
-                    template.save(doc_stream)
-                    doc_stream.seek(0)
-                    zip_file.writestr(contract_filename, doc_stream.read())
-                if generate_summaries:
-                    summary = generate_contract_summary(row)
-                    summaries.append({
-                        'name': str(row['Party B Name']).strip(),
-                        'summary': summary,
-                        'filename': f'Summary_{safe_name}_{today}.txt'
-                    })
-                    nickname = str(row.get('Main Platform nickname', '')).strip()
-                    summary_filename = f'{name_value}_{nickname}_summary.txt'
-                    if output_mode in ["配对输出", "单独文件"]:
-                        zip_file.writestr(summary_filename, summary)
-            except Exception as e:
-                st.error(f"❌ Error processing {row.get('Party B Name', f'Row {index}')} (row {index}): {e}")
-    if generate_summaries and output_mode == "合并文件" and summaries:
-        combined_summary = ""
-        for i, item in enumerate(summaries, 1):
-            combined_summary += f"=== {item['name']} ===\n"
-            combined_summary += item['summary']
-            combined_summary += "\n\n"
-        combined_filename = f'All_Summaries_{today}.txt'
-        zip_file.writestr(combined_filename, combined_summary)
-    return zip_buffer, summaries, contract_files
-
-def process_form_data(form_records, uploaded_template, generate_contracts, generate_summaries, output_mode):
-    """处理表单数据"""
-    today = date.today().isoformat()
-    zip_buffer = io.BytesIO()
-    summaries = []
-    contract_files = []
-    
-    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED) as zip_file:
-        for record in form_records:
-            try:
-                safe_name = str(record['Party B Name']).replace(" ", "_").replace("/", "-")
-                
-                if generate_contracts:
-                    template = DocxTemplate(uploaded_template)
-                    video_rate_value = record['Video Rate']
-                    is_video_rate_empty = str(video_rate_value).strip() == ""
-                    
-                    # 自动推断内容
-                    platform_fields = infer_platform_fields(record)
-                    date_fields = infer_date_versions(record)
-                    bonus_info = infer_bonus_info(record)
-                    payment_fields = infer_payment_fields(record)
-                    
-                    context = {
-                        'Influencer_name': record['Party B Name'],
-                        'Influencer_email': record['Email'],
-                        'Influencer_contact': "N/A" if str(record['Contact']).strip() == "" else record['Contact'],
-                        'Influencer_address': record['Address'],
-                        'platform': platform_fields['platform'],
-                        'platform_username': platform_fields['platform_username'],
-                        'Influencer_links': platform_fields['Influencer_links'],
-                        'promotion_date': date_fields['promotion_date'],
-                        'video_rate': "{:.2f}".format(float(video_rate_value)) if not is_video_rate_empty else "",
-                        'video_number': record['Estimated Videos'],
-                        'bonus_info': bonus_info['bonus_info'],
-                        'payment_method': record['Payment method'],
-                        'payment_information': record['Payment Info'],
-                        'payment_charges': payment_fields['payment_charges']
-                    }
-                    
-                    template.render(context)
-                    start_date = record.get('Start date', '')
-                    start_datetime = datetime.strptime(str(start_date).strip(), '%Y-%m-%d')
-                    contract_month = start_datetime.strftime('%Y-%m')
-                    contract_filename = f'FW-ARETIS & {record["Party B Name"]}_{contract_month}.docx'
-                    contract_files.append(contract_filename)
-                    
-                    doc_stream = io.BytesIO()
-                    template.save(doc_stream)
-                    doc_stream.seek(0)
-                    zip_file.writestr(contract_filename, doc_stream.read())
-                
-                if generate_summaries:
-                    summary = generate_contract_summary(record)
-                    summaries.append({
-                        'name': str(record['Party B Name']).strip(),
-                        'summary': summary,
-                        'filename': f'Summary_{safe_name}_{today}.txt'
-                    })
-                    
-                    nickname = str(record.get('Main Platform nickname', '')).strip()
-                    summary_filename = f'{record["Party B Name"]}_{nickname}_summary.txt'
-                    if output_mode in ["配对输出", "单独文件"]:
-                        zip_file.writestr(summary_filename, summary)
-                        
-            except Exception as e:
-                st.error(f"❌ Error processing {record.get('Party B Name', 'Unknown')}: {e}")
-    
-    if generate_summaries and output_mode == "合并文件" and summaries:
-        combined_summary = ""
-        for i, item in enumerate(summaries, 1):
-            combined_summary += f"=== {item['name']} ===\n"
-            combined_summary += item['summary']
-            combined_summary += "\n\n"
-        combined_filename = f'All_Summaries_{today}.txt'
-        zip_file.writestr(combined_filename, combined_summary)
-    
-    return zip_buffer, summaries, contract_files
 
 # Process files
+if 'job_ids' not in st.session_state:
+    st.session_state.job_ids = []
+
 if generate:
+    # 预渲染的合同保存在渲染缓存中，开启预渲染时生成也要读取缓存
+    render_cache = RenderCache() if use_render_cache or eager else None
+    # 两种模式共用的任务选项，按参数名传给 run_form_job / run_roster_job
+    job_options = dict(
+        fast_path=fast_path, generate_contracts=generate_contracts, generate_summaries=generate_summaries, output_mode=output_mode,
+        workers=workers, render_cache=render_cache, input_cache=get_input_cache(), on_invalid=on_invalid, resumable=resumable,
+        summary_table=summary_table, routes=routes, record_history=record_history, store_documents=store_documents, dedupe=dedupe,
+    )
+    run = None
     if input_mode == "📝 表单填写（推荐）":
         # 表单模式处理
-        if not st.session_state.form_records:
+        if not len(st.session_state.form_store):
             st.warning("⚠️ 请先添加至少一条记录！")
         elif not uploaded_template:
             st.warning("⚠️ 请上传Word模板文件！")
         else:
-            st.success("✅ 表单数据准备就绪！")
-            
-            # 显示处理进度
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            try:
-                zip_buffer, summaries, contract_files = process_form_data(
-                    st.session_state.form_records, 
-                    uploaded_template, 
-                    generate_contracts, 
-                    generate_summaries, 
-                    output_mode
-                )
-                progress_bar.progress(100)
-                status_text.text("✅ 处理完成！")
-                
-                zip_buffer.seek(0)
-                
-                # 显示生成结果
-                st.markdown("### ✅ Generation Complete!")
-                
-                if generate_contracts:
-                    st.success(f"📄 Generated {len(contract_files)} contract files")
-                
-                if generate_summaries:
-                    st.success(f"📝 Generated {len(summaries)} summary files")
-                
-                # 下载按钮
-                download_filename = f"KOC_Form_Output_{date.today().isoformat()}.zip"
-                st.download_button(
-                    "📥 Download All Files", 
-                    zip_buffer, 
-                    file_name=download_filename, 
-                    mime="application/zip"
-                )
-            
-            except Exception as e:
-                st.error(f"❌ Processing failed: {str(e)}")
+            # 记录和模板在提交时复制一份，之后页面上的修改不影响正在运行的任务
+            records = st.session_state.form_store.to_records()
+            run = partial(run_form_job, records=records, template_data=uploaded_template.getvalue(), **job_options)
+            title = f"表单 {len(records)} 条记录"
+            download_filename = f"KOC_Form_Output_{date.today().isoformat()}.zip"
     
     else:
         # CSV模式处理（原有功能）
         if not uploaded_csv or not uploaded_template:
-            st.warning("⚠️ 请上传CSV文件和Word模板文件！")
+            st.warning("⚠️ 请上传CSV/Excel名单和Word模板文件！")
         elif not generate_contracts and not generate_summaries:
             st.warning("请至少选择一个生成选项！")
         else:
-            st.success("✅ Files uploaded successfully!")
-            try:
-                df = pd.read_csv(uploaded_csv, encoding='utf-8', keep_default_na=False, dtype=str)
-            except UnicodeDecodeError:
-                uploaded_csv.seek(0)
-                df = pd.read_csv(uploaded_csv, encoding='gbk', keep_default_na=False, dtype=str)
-            df.columns = df.columns.str.strip()
-            
-            # 显示处理进度
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            try:
-                zip_buffer, summaries, contract_files = process_data(df, uploaded_template, generate_contracts, generate_summaries, output_mode)
-                progress_bar.progress(100)
-                status_text.text("✅ 处理完成！")
-                
-                zip_buffer.seek(0)
-                
-                # 显示生成结果
-                st.markdown("### ✅ Generation Complete!")
-                
-                if generate_contracts:
-                    st.success(f"📄 Generated {len(contract_files)} contract files")
-                
-                if generate_summaries:
-                    st.success(f"📝 Generated {len(summaries)} summary files")
-                
-                # 下载按钮
-                download_filename = f"KOC_Output_{date.today().isoformat()}.zip"
-                st.download_button(
-                    "📥 Download All Files", 
-                    zip_buffer, 
-                    file_name=download_filename, 
-                    mime="application/zip"
-                )
-            
-            except Exception as e:
-                st.error(f"❌ Processing failed: {str(e)}")
+            run = partial(run_roster_job, roster_data=uploaded_csv.getvalue(), roster_name=uploaded_csv.name, sheet_name=sheet_name, stream=stream_csv,
+                          template_data=uploaded_template.getvalue(), **job_options)
+            title = uploaded_csv.name
+            download_filename = f"KOC_Output_{date.today().isoformat()}.zip"
+
+    if run is not None:
+        job_id = get_job_manager().submit(run, title, download_filename, workers)
+        st.session_state.job_ids.insert(0, job_id)
+        st.success(f"✅ 已提交任务 `{job_id}`，生成在后台进行，可以继续操作页面；其他会话也可以凭任务ID查看和下载。")
 
 else:
     if input_mode == "📝 表单填写（推荐）":
         st.info("📝 请填写表单信息，然后点击 Generate 按钮生成合同。")
     else:
         st.info("⬆️ Upload both files above to get started, then click Generate.")
+
+# 生成任务
+st.markdown("### 📦 生成任务")
+lookup_id = st.text_input("按任务ID查看", placeholder="输入其他会话提交的任务ID")
+input_cache = get_input_cache()
+if input_cache.hits or input_cache.misses:
+    st.caption(f"📥 已解析的名单/模板缓存：命中 {input_cache.hits}，未命中 {input_cache.misses}，占用约 {input_cache.size() / 1024 / 1024:.1f} MB")
+if lookup_id and lookup_id.strip() not in st.session_state.job_ids:
+    st.session_state.job_ids.insert(0, lookup_id.strip())
+
+if st.session_state.job_ids:
+    active = any(
+        job is not None and not job.finished
+        for job in map(get_job_manager().get, st.session_state.job_ids)
+    )
+    # 有任务在运行时定时刷新这一块（不重新运行整个页面）
+    if active and hasattr(st, 'fragment'):
+        st.fragment(run_every=1)(show_jobs)(auto_refresh=True)
+    else:
+        show_jobs()
+        if active:
+            st.button("🔄 刷新任务状态")
+
+# 合同历史
+st.markdown("### 📚 合同历史")
+with st.expander("按邮箱、姓名、平台账号、合同月份查询已生成的合同", expanded=False):
+    # 查询、选择结果时只重新运行这一块
+    if hasattr(st, 'fragment'):
+        st.fragment(show_history)()
+    else:
+        show_history()
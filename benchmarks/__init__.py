@@ -0,0 +1 @@
+"""生成流程的基准测试（合成名单与模板），见 benchmarks.run"""
@@ -0,0 +1,285 @@
+"""生成流程的基准测试：python -m benchmarks.run --sizes 10 1000 --output results.json
+
+对每个名单规模和模板大小分别测量：
+- CSV 路径：ingest（read_roster）、derive（选行 + derive_jobs）、render、save、archive
+  各阶段的耗时与每秒行数，以及 process_data 的端到端结果；
+- 表单路径：ingest（records_to_frame）、derive，以及 process_form_data 的端到端结果。
+
+render / save / archive 在同一遍循环里交替执行、分别计时（逐行保存全部文档会占满内存），
+三者共用一个峰值内存 contracts_peak_rss_mb。峰值内存在 Linux 上每个阶段开始前清零，
+其他系统上为进程启动以来的峰值。结果为 JSON，方便不同版本之间对比。
+--fast 时所有路径都启用快速渲染（fastpath），用于和默认的 docxtpl 渲染对比。
+--imports 只测量冷启动：在新的解释器中导入各模块、运行一遍 Streamlit 页面脚本的耗时，
+以及加载了哪些重依赖；超过 --import-budget 秒时退出码为1，可用于 CI 防止启动变慢。
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from .synthetic import form_records, roster_csv_bytes, template_bytes
+
+DEFAULT_SIZES = [10, 1000, 10000, 50000]
+DEFAULT_TEMPLATES = ['small', 'large']
+DEFAULT_PATHS = ['csv', 'form']
+# 冷启动测量的导入目标；'app' 为运行一遍 app.py（表单模式的首屏，不含 streamlit 本身的导入）
+DEFAULT_IMPORT_TARGETS = ['koc_generator', 'koc_generator.records', 'koc_generator.engine', 'koc_generator.cli', 'app']
+# 检查是否在冷启动时被加载的重依赖
+HEAVY_MODULES = ['pandas', 'numpy', 'docxtpl', 'jinja2', 'lxml', 'docx', 'openpyxl']
+DEFAULT_IMPORT_BUDGET = 0.5
+
+_IMPORT_PROBE = '''
+import json, sys, time
+target, heavy = sys.argv[1], sys.argv[2].split(',')
+if target == 'app':
+    # streamlit 本身的导入不计入页面脚本的耗时
+    import logging, runpy, streamlit
+    logging.disable(logging.WARNING)
+start = time.perf_counter()
+if target == 'app':
+    runpy.run_path('app.py', run_name='__main__')
+else:
+    __import__(target)
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'heavy_modules': [name for name in heavy if name in sys.modules]}))
+'''
+
+
+def _reset_peak_rss():
+    # 写入 5 会把 VmHWM 重置为当前 RSS（Linux 4.0+）
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as fh:
+            match = re.search(r'VmHWM:\s+(\d+) kB', fh.read())
+        if match:
+            return int(match.group(1)) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位是字节，Linux 是 KB
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _stage(seconds, rows, peak_rss_mb=None):
+    result = {
+        'seconds': round(seconds, 4),
+        'rows_per_s': round(rows / seconds, 1) if seconds > 0 else None,
+    }
+    if peak_rss_mb is not None:
+        result['peak_rss_mb'] = round(peak_rss_mb, 1)
+    return result
+
+
+def measure(func, *args, **kwargs):
+    """执行一次 func，返回 (结果, 秒数, 峰值内存MB)"""
+    _reset_peak_rss()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start, _peak_rss_mb()
+
+
+def _ignore_error(message):
+    pass
+
+
+def _derive(df):
+    from koc_generator.engine import derive_jobs, select_roster_rows
+
+    rows, labels = select_roster_rows(df)
+    return derive_jobs(rows, labels, True, True)
+
+
+def _derive_form(records):
+    from koc_generator.engine import _text, derive_jobs, records_to_frame
+
+    rows = records_to_frame(records)
+    return derive_jobs(rows, _text(rows, 'Party B Name', 'Unknown').tolist(), True, True)
+
+
+def _write_contracts(jobs, template):
+    """与 write_jobs 相同的工作，分别统计 render / save / archive 的耗时"""
+    from koc_generator.archive import ArchiveWriter
+
+    timings = {'render': 0.0, 'save': 0.0, 'archive': 0.0}
+    archive = ArchiveWriter()
+    for job in jobs:
+        if 'error' in job:
+            continue
+        row_timings = {}
+        data = template.render_bytes(job['context'], row_timings)
+        start = time.perf_counter()
+        archive.writestr(job['contract_filename'], data)
+        archive.writestr(job['summary_filename'], job['summary'])
+        timings['render'] += row_timings['render']
+        timings['save'] += row_timings['save']
+        timings['archive'] += time.perf_counter() - start
+    start = time.perf_counter()
+    archive.download_data().close()
+    timings['archive'] += time.perf_counter() - start
+    return timings
+
+
+def bench_csv(rows, template_data, workers, fast_path=False):
+    from koc_generator.engine import process_data, read_roster
+    from koc_generator.template import CompiledTemplate
+
+    csv_data = roster_csv_bytes(rows)
+    df, ingest_seconds, ingest_rss = measure(read_roster, io.BytesIO(csv_data))
+    jobs, derive_seconds, derive_rss = measure(_derive, df)
+    timings, _, contracts_rss = measure(_write_contracts, jobs, CompiledTemplate(template_data, fast_path))
+    del jobs
+    (archive, _, _), total_seconds, total_rss = measure(
+        process_data, df, CompiledTemplate(template_data, fast_path), True, True, "配对输出", workers, on_error=_ignore_error
+    )
+    archive.close()
+    return {
+        'stages': {
+            'ingest': _stage(ingest_seconds, rows, ingest_rss),
+            'derive': _stage(derive_seconds, rows, derive_rss),
+            'render': _stage(timings['render'], rows),
+            'save': _stage(timings['save'], rows),
+            'archive': _stage(timings['archive'], rows),
+        },
+        'contracts_peak_rss_mb': round(contracts_rss, 1),
+        'end_to_end': _stage(total_seconds, rows, total_rss),
+    }
+
+
+def bench_form(rows, template_data, workers, fast_path=False):
+    from koc_generator.engine import process_form_data, records_to_frame
+    from koc_generator.template import CompiledTemplate
+
+    records = form_records(rows)
+    _, ingest_seconds, ingest_rss = measure(records_to_frame, records)
+    _, derive_seconds, derive_rss = measure(_derive_form, records)
+    (archive, _, _), total_seconds, total_rss = measure(
+        process_form_data, records, CompiledTemplate(template_data, fast_path), True, True, "配对输出", workers, on_error=_ignore_error
+    )
+    archive.close()
+    return {
+        'stages': {
+            'ingest': _stage(ingest_seconds, rows, ingest_rss),
+            'derive': _stage(derive_seconds, rows, derive_rss),
+        },
+        'end_to_end': _stage(total_seconds, rows, total_rss),
+    }
+
+
+def bench_import(target):
+    """在新的解释器中导入 target（或运行 app.py），返回耗时和已加载的重依赖"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-c', _IMPORT_PROBE, target, ','.join(HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, cwd=root,
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'target': target, 'seconds': round(probe['seconds'], 3), 'heavy_modules': probe['heavy_modules']}
+
+
+def run_imports(targets=DEFAULT_IMPORT_TARGETS, budget=DEFAULT_IMPORT_BUDGET):
+    """冷启动测量；within_budget 为 'koc_generator' 和 'app' 是否都在 budget 秒内"""
+    results = []
+    for target in targets:
+        print(f"import {target} ...", file=sys.stderr)
+        results.append(bench_import(target))
+    checked = [result['seconds'] for result in results if result['target'] in ('koc_generator', 'app')]
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'budget_seconds': budget,
+        'within_budget': all(seconds <= budget for seconds in checked),
+        'environment': environment(),
+        'imports': results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import docxtpl
+    import pandas
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pandas.__version__,
+        'docxtpl': getattr(docxtpl, '__version__', None),
+        'commit': _git_commit(),
+    }
+
+
+def run(sizes=DEFAULT_SIZES, templates=DEFAULT_TEMPLATES, paths=DEFAULT_PATHS, workers=1, fast_path=False):
+    """依次运行所有组合，返回可直接写成 JSON 的结果"""
+    benches = {'csv': bench_csv, 'form': bench_form}
+    results = []
+    for template_size in templates:
+        template_data = template_bytes(template_size)
+        for rows in sizes:
+            for path in paths:
+                print(f"{path} path, {rows} rows, {template_size} template ...", file=sys.stderr)
+                result = benches[path](rows, template_data, workers, fast_path)
+                results.append({'path': path, 'rows': rows, 'template': template_size, **result})
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'workers': workers,
+        'fast_path': fast_path,
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='KOC合同生成流程的基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='名单行数（默认 10 1000 10000 50000）')
+    parser.add_argument('--templates', nargs='+', choices=DEFAULT_TEMPLATES, default=DEFAULT_TEMPLATES, help='模板大小')
+    parser.add_argument('--paths', nargs='+', choices=DEFAULT_PATHS, default=DEFAULT_PATHS, help='测试的数据路径')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='端到端测试的并行进程数')
+    parser.add_argument('--fast', action='store_true', help='启用快速渲染')
+    parser.add_argument('--imports', action='store_true', help='只测量冷启动（导入和页面首屏的耗时）')
+    parser.add_argument('--import-budget', type=float, default=DEFAULT_IMPORT_BUDGET,
+                        help=f'冷启动耗时上限（秒，默认{DEFAULT_IMPORT_BUDGET}），超过时退出码为1')
+    parser.add_argument('-o', '--output', help='结果JSON文件（不指定则输出到标准输出）')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.imports:
+        report = run_imports(budget=args.import_budget)
+    else:
+        report = run(args.sizes, args.templates, args.paths, args.workers, args.fast)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+    return 0 if report.get('within_budget', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
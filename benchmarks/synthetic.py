@@ -0,0 +1,111 @@
+"""基准测试用的合成数据：名单（CSV字节或表单记录）与Word模板，固定随机种子可复现"""
+
+import csv
+import io
+import random
+
+from docx import Document
+
+# 与真实名单相同的列；列名前后带空格的情况也照搬（读取时会去掉）
+ROSTER_COLUMNS = [
+    ' Party B Name ', 'Email', 'Contact', ' Address ', 'Video Rate', 'Estimated Videos',
+    ' Start date ', 'end date', 'Payment method', ' Bonus ', 'Main Platform nickname',
+    'Statement', ' No. of Posted Videos ', 'Payment Info', 'TT', ' IG ', 'YT', 'FB', ' kwai ',
+]
+
+# 平台组合、奖励档位、付款方式及其大致占比
+PLATFORM_MIX = [(('TT',), 40), (('IG',), 15), (('YT',), 10), (('TT', 'IG'), 20), (('TT', 'IG', 'YT'), 8), (('FB',), 4), (('kwai',), 3)]
+BONUS_MIX = [('none', 60), ('lower', 25), ('higher', 10), ('Higher ', 5)]
+PAYMENT_MIX = [('PayPal', 55), ('bank', 35), ('Payoneer', 10)]
+STATEMENT_MIX = [('正在履行/未开始履行', 70), ('已履行完毕', 30)]
+
+# 模板中的占位符，与 derive_jobs 生成的 context 一致
+TEMPLATE_FIELDS = [
+    'Influencer_name', 'Influencer_email', 'Influencer_contact', 'Influencer_address',
+    'platform', 'platform_username', 'Influencer_links', 'promotion_date', 'video_rate',
+    'video_number', 'bonus_info', 'payment_method', 'payment_information', 'payment_charges',
+]
+
+FILLER_TEXT = "Party B shall produce and publish the agreed videos in accordance with the brief provided by Party A. " * 3
+
+
+def _choose(rng, mix):
+    values, weights = zip(*mix)
+    return rng.choices(values, weights)[0]
+
+
+def roster_rows(rows, seed=0):
+    """逐行产出合成名单的字段字典（列名不含首尾空格）"""
+    rng = random.Random(seed)
+    for i in range(rows):
+        month = rng.randint(1, 12)
+        end_month = min(12, month + rng.choice([0, 0, 1, 2]))
+        platforms = _choose(rng, PLATFORM_MIX)
+        payment = _choose(rng, PAYMENT_MIX)
+        statement = _choose(rng, STATEMENT_MIX)
+        handle = f"creator_{i}"
+        row = {
+            'Party B Name': f"KOC Creator {i}",
+            'Email': f"creator{i}@example.com",
+            'Contact': rng.choice(['', f"+1 555 {i % 10000:04d}"]),
+            'Address': f"{rng.randint(1, 999)} Example Street, Unit {i}, Springfield",
+            'Video Rate': rng.choice(['50', '80', '120.5', '200', '350']),
+            'Estimated Videos': str(rng.randint(1, 10)),
+            'Start date': f"2025-{month:02d}-01",
+            'end date': rng.choice(['', f"2025-{end_month:02d}-28"]),
+            'Payment method': payment,
+            'Bonus': _choose(rng, BONUS_MIX),
+            'Main Platform nickname': rng.choice(['', f"@{handle}"]),
+            'Statement': statement,
+            'No. of Posted Videos': str(rng.randint(1, 10)) if statement == '已履行完毕' else '',
+            'Payment Info': f"{handle}@paypal.example" if payment == 'PayPal' else f"ACCT {rng.randint(10**9, 10**10 - 1)}",
+        }
+        for key in ['TT', 'IG', 'YT', 'FB', 'kwai']:
+            row[key] = handle if key in platforms else ''
+        yield row
+
+
+def roster_csv_bytes(rows, seed=0):
+    """合成的CSV名单：表头 + 两行说明行 + rows 行数据 + 末尾空行，与真实导出格式相同"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ROSTER_COLUMNS)
+    writer.writerow(['说明'] * len(ROSTER_COLUMNS))
+    writer.writerow(['示例'] * len(ROSTER_COLUMNS))
+    keys = [column.strip() for column in ROSTER_COLUMNS]
+    for row in roster_rows(rows, seed):
+        writer.writerow([row[key] for key in keys])
+    writer.writerow([''] * len(ROSTER_COLUMNS))
+    return buffer.getvalue().encode('utf-8')
+
+
+def form_records(rows, seed=0):
+    """合成的表单记录（与 create_form_record 的字段一致）"""
+    return list(roster_rows(rows, seed))
+
+
+def template_bytes(size='small'):
+    """合成的Word模板：small 约一页，large 把条款重复多次并带表格，接近长合同"""
+    repeats = {'small': 1, 'large': 25}[size]
+    document = Document()
+    document.core_properties.title = "Contract {{ Influencer_name }}"
+    document.add_heading("KOC Cooperation Agreement – {{ Influencer_name }}", 0)
+    for section in range(repeats):
+        document.add_heading(f"Section {section + 1}", 1)
+        for field in TEMPLATE_FIELDS:
+            paragraph = document.add_paragraph(f"{field.replace('_', ' ').title()}: ")
+            run = paragraph.add_run("{{ " + field + " }}")
+            run.bold = True
+        for _ in range(8):
+            document.add_paragraph(FILLER_TEXT)
+        table = document.add_table(rows=4, cols=2)
+        for row, field in zip(table.rows, ['Influencer_name', 'platform', 'video_rate', 'promotion_date']):
+            row.cells[0].text = field
+            row.cells[1].text = "{{ " + field + " }}"
+    header = document.sections[0].header.paragraphs[0]
+    header.text = "Agreement with {{ Influencer_name }}"
+    footer = document.sections[0].footer.paragraphs[0]
+    footer.text = "Promotion period: {{ promotion_date }}"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
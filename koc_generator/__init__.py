@@ -0,0 +1,38 @@
+"""KOC合同生成器的核心模块
+
+包本身不导入任何子模块：用到 RenderCache 等名称时才导入对应的模块，
+只用到轻量部分（缓存、任务、报告）的调用方不会加载 pandas、docxtpl。
+"""
+
+import importlib
+
+# 公开名称 -> 所在的子模块
+_EXPORTS = {
+    'ArchiveWriter': 'archive',
+    'CompiledTemplate': 'template',
+    'ContractRenderer': 'render',
+    'DEFAULT_CACHE_BYTES': 'cache',
+    'DEFAULT_CACHE_DIR': 'cache',
+    'DEFAULT_SPOOL_THRESHOLD': 'archive',
+    'JobManager': 'jobs',
+    'default_workers': 'render',
+    'prewarm_workers': 'render',
+    'read_template_bytes': 'template',
+    'RenderCache': 'cache',
+    'RunReport': 'report',
+    'render_contracts': 'render',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,170 @@
+"""流式输出的ZIP压缩包，超过内存阈值后写入磁盘临时文件"""
+
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# 压缩包超过该大小（字节）后转存到磁盘
+DEFAULT_SPOOL_THRESHOLD = 64 * 1024 * 1024
+# 文本条目（概括、报告）的 deflate 压缩级别，与 zlib 默认相同
+DEFAULT_COMPRESSLEVEL = 6
+# 并行压缩的线程数；zlib 压缩时释放 GIL，多核上可以与渲染同时进行
+DEFAULT_COMPRESS_THREADS = min(4, os.cpu_count() or 1)
+# 本身已经压缩过的格式（.docx 就是 deflate 过的 ZIP），再压缩几乎不会变小，直接存储
+STORED_SUFFIXES = ('.docx', '.xlsx', '.zip', '.png', '.jpg', '.jpeg')
+# 每个线程最多排队的条目数，超过后等待最早的条目写入
+PENDING_PER_THREAD = 8
+
+
+def entry_compression(name, compression=zipfile.ZIP_DEFLATED):
+    """条目的压缩方式：已压缩的格式直接存储，其他使用 compression"""
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_SUFFIXES) else compression
+
+
+def _deflate(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data)
+
+
+class _SpoolFile:
+    """先写入内存，超过阈值后整体转存到临时文件（ZipFile 只需要 write/tell/seek/flush）"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.buffer = io.BytesIO()
+        self.disk_file = None
+
+    @property
+    def current(self):
+        return self.disk_file if self.disk_file is not None else self.buffer
+
+    def write(self, data):
+        written = self.current.write(data)
+        if self.disk_file is None and self.buffer.tell() > self.threshold:
+            self.rollover()
+        return written
+
+    def rollover(self):
+        position = self.buffer.tell()
+        self.disk_file = tempfile.TemporaryFile(suffix='.zip')
+        self.disk_file.write(self.buffer.getbuffer())
+        self.disk_file.seek(position)
+        self.buffer = None
+
+    def tell(self):
+        return self.current.tell()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.current.seek(offset, whence)
+
+    def flush(self):
+        self.current.flush()
+
+
+class ArchiveWriter:
+    """把每个条目直接写入临时缓冲的ZIP写入器
+
+    用法与 zipfile.ZipFile 相同（with 语句 + writestr），
+    关闭后通过 download_data() 取得可交给 st.download_button 的文件对象。
+    所有条目使用同一个修改时间（默认当天零点），相同的输入得到相同的压缩包。
+
+    .docx 等已压缩的条目直接存储，其他条目按 compresslevel 压缩。threads 大于1时
+    压缩在线程池中进行，条目仍按 writestr 的调用顺序写入，结果与单线程完全相同。
+    """
+
+    def __init__(self, spool_threshold=DEFAULT_SPOOL_THRESHOLD, compression=zipfile.ZIP_DEFLATED, date_time=None,
+                 compresslevel=DEFAULT_COMPRESSLEVEL, threads=DEFAULT_COMPRESS_THREADS):
+        self.file = _SpoolFile(spool_threshold)
+        self.zip_file = zipfile.ZipFile(self.file, 'w', compression)
+        self.date_time = date_time or date.today().timetuple()[:6]
+        self.compresslevel = compresslevel
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='koc-zip') if threads > 1 else None
+        self._max_pending = threads * PENDING_PER_THREAD
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        try:
+            self._drain(0)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self.zip_file.close()
+
+    def writestr(self, name, data):
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type = entry_compression(name, self.zip_file.compression)
+        info.external_attr = 0o600 << 16
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self._executor is None or info.compress_type != zipfile.ZIP_DEFLATED:
+            # 直接存储的条目也要排在尚未写入的压缩条目之后
+            self._drain(0)
+            self.zip_file.writestr(info, data, compresslevel=self.compresslevel)
+            return
+        self._pending.append((info, len(data), self._executor.submit(_deflate, data, self.compresslevel)))
+        self._drain(self._max_pending)
+
+    def write_stream(self, name, fileobj):
+        """从可 seek 的文件对象分块读取并写入一个条目，内容不必整体放进内存"""
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type = entry_compression(name, self.zip_file.compression)
+        info.external_attr = 0o600 << 16
+        # ZipFile.open 不接受压缩级别参数，与 writestr(compresslevel=...) 一样设在 ZipInfo 上
+        info._compresslevel = self.compresslevel
+        # 预先给出大小，超过 ZIP64 限制时 ZipFile.open 会写出 ZIP64 头
+        info.file_size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        self._drain(0)
+        with self.zip_file.open(info, 'w') as dest:
+            shutil.copyfileobj(fileobj, dest)
+
+    def _drain(self, keep):
+        """按提交顺序写入已压缩的条目，直到排队的条目不超过 keep 个"""
+        while self._pending and (len(self._pending) > keep or self._pending[0][2].done()):
+            info, size, future = self._pending.popleft()
+            compressed, crc = future.result()
+            self._write_compressed(info, size, compressed, crc)
+
+    def _write_compressed(self, info, size, compressed, crc):
+        # 与 ZipFile.writestr 写出的本地记录相同，只是压缩已经在线程中完成
+        zip_file = self.zip_file
+        info.file_size = size
+        info.compress_size = len(compressed)
+        info.CRC = crc
+        info.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(info)
+        zip_file._didModify = True
+        zip_file.fp.write(info.FileHeader(size * 1.05 > zipfile.ZIP64_LIMIT))
+        zip_file.fp.write(compressed)
+        zip_file.filelist.append(info)
+        zip_file.NameToInfo[info.filename] = info
+        zip_file.start_dir = zip_file.fp.tell()
+
+    @property
+    def on_disk(self):
+        return self.file.disk_file is not None
+
+    def download_data(self):
+        """返回从头读取的压缩包：仍在内存时为 BytesIO，已落盘时为只读文件"""
+        self.close()
+        if not self.on_disk:
+            self.file.buffer.seek(0)
+            return self.file.buffer
+        disk_file = self.file.disk_file
+        disk_file.flush()
+        reader = io.open(os.dup(disk_file.fileno()), 'rb')
+        reader.seek(0)
+        return reader
@@ -0,0 +1,127 @@
+"""磁盘上的合同渲染缓存：按内容寻址，超过容量后淘汰最久未使用的文档"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+# 默认缓存目录与容量（字节）
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'koc_generator_cache')
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def template_digest(template_bytes):
+    """模板内容的哈希，模板有任何改动都会得到新的缓存键"""
+    return hashlib.sha256(template_bytes).hexdigest()
+
+
+def cache_key(digest, context):
+    """缓存键：模板哈希 + 完整 context 的哈希（键按顺序排列，与字段顺序无关）"""
+    payload = json.dumps(context, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{digest}\n{payload}'.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """以缓存键为文件名保存渲染好的 .docx 字节
+
+    文件按修改时间排序即为使用顺序：命中时更新修改时间，写入后总大小超过
+    max_bytes 就删除最久未使用的文件。写入先落到临时文件再改名，
+    多个会话或进程共用同一目录时不会读到写了一半的文档。
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # 命中/未命中次数，由渲染器统计
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._load()
+
+    def _load(self):
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.docx'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.docx')
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def contains(self, key):
+        return key in self._entries or os.path.exists(self._path(key))
+
+    def get(self, key):
+        """返回缓存的文档字节，没有时返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # 可能已被其他会话淘汰
+            self._forget(key)
+            return None
+        if key not in self._entries:
+            self._size += len(data)
+        self._entries[key] = len(data)
+        self._entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._forget(key)
+        self._entries[key] = len(data)
+        self._size += len(data)
+        self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for key in list(self._entries):
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._entries.clear()
+        self._size = 0
@@ -0,0 +1,134 @@
+"""断点续跑：边生成边把完成的合同和已完成行的日志写入工作目录
+
+服务器重启或页面断开时，内存中的压缩包会丢失；开启断点续跑后，用同样的名单和模板
+重新生成会直接取用工作目录里已完成的合同，只渲染剩下的行。
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from .cache import cache_key, template_digest
+
+# 默认的工作目录根目录；每次运行在其下按输入内容建子目录
+DEFAULT_CHECKPOINT_DIR = os.path.join(tempfile.gettempdir(), 'koc_generator_checkpoints')
+JOURNAL_NAME = 'journal.txt'
+KEY_LENGTH = 64
+
+# 本进程中正在使用的工作目录（见 Checkpoint.claim）
+_in_use = set()
+_in_use_lock = threading.Lock()
+
+
+def checkpoint_directory(*parts, root=DEFAULT_CHECKPOINT_DIR):
+    """按输入内容（名单、模板等的字节）确定的工作目录，同样的输入总是得到同一个目录"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return os.path.join(root, digest.hexdigest()[:16])
+
+
+class Checkpoint:
+    """一个工作目录：contracts/ 下按行键保存已完成的合同，journal.txt 每行一个已完成的行键
+
+    行键与渲染缓存的键相同（模板哈希 + context），模板或该行数据改动后不会误用旧文件。
+    合同先写入临时文件再改名，之后才追加日志；日志的最后一行如果只写了一半会被忽略。
+    """
+
+    @classmethod
+    def claim(cls, directory):
+        """打开 directory；本进程中已有任务在使用它时依次改用 directory-2、directory-3……
+
+        同样的输入同时生成两次时各用各的目录，先完成的任务删除目录不会影响另一个；
+        中断后重新生成时原目录已空闲，仍然接着上次的进度。
+        """
+        with _in_use_lock:
+            candidate = directory
+            number = 2
+            while candidate in _in_use:
+                candidate = f"{directory}-{number}"
+                number += 1
+            _in_use.add(candidate)
+        try:
+            return cls(candidate)
+        except BaseException:
+            _release(candidate)
+            raise
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.digest = None
+        self.resumed = 0
+        os.makedirs(os.path.join(directory, 'contracts'), exist_ok=True)
+        self.done = self._load()
+        self._journal = open(os.path.join(directory, JOURNAL_NAME), 'a', encoding='ascii')
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, JOURNAL_NAME), encoding='ascii', errors='replace') as fh:
+                keys = [line.strip() for line in fh]
+        except FileNotFoundError:
+            return set()
+        return {key for key in keys if len(key) == KEY_LENGTH and os.path.exists(self._path(key))}
+
+    def _path(self, key):
+        return os.path.join(self.directory, 'contracts', key + '.docx')
+
+    def __len__(self):
+        return len(self.done)
+
+    def start(self, template):
+        """绑定本次使用的模板"""
+        self.digest = template_digest(template.template_bytes)
+
+    def key(self, context):
+        return cache_key(self.digest, context)
+
+    def contract(self, key):
+        """取出已完成的合同，并计入 resumed"""
+        with open(self._path(key), 'rb') as fh:
+            data = fh.read()
+        self.resumed += 1
+        return data
+
+    def record(self, key, data):
+        """保存一行完成的合同并记入日志"""
+        if key in self.done:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'contracts'), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._journal.write(key + '\n')
+        self.done.add(key)
+
+    def sync(self):
+        """把日志刷到磁盘；每批结束时调用"""
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _close_journal(self):
+        if not self._journal.closed:
+            self.sync()
+            self._journal.close()
+
+    def close(self):
+        self._close_journal()
+        _release(self.directory)
+
+    def remove(self):
+        """生成成功后删除工作目录"""
+        self._close_journal()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        _release(self.directory)
+
+
+def _release(directory):
+    with _in_use_lock:
+        _in_use.discard(directory)
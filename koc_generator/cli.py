@@ -0,0 +1,201 @@
+"""命令行入口：python -m koc_generator roster.csv|roster.xlsx --template 模板.docx --output-dir 输出目录
+
+查询合同历史：python -m koc_generator history --email 邮箱 | --name 姓名 | --username 账号 | --month YYYY-MM
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import date
+
+# --summary-output 的取值与引擎中的概括输出方式
+OUTPUT_MODES = {'paired': "配对输出", 'separate': "单独文件", 'combined': "合并文件"}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m koc_generator',
+        description='根据CSV名单和Word模板批量生成KOC合同及概括',
+    )
+    parser.add_argument('csv', nargs='+', help='CSV或Excel名单文件（.csv/.xlsx/.xls），可传多个')
+    parser.add_argument('-t', '--template', required=True, help='Word模板 (.docx)')
+    parser.add_argument('-o', '--output-dir', required=True, help='压缩包输出目录')
+    parser.add_argument('--contracts-only', action='store_true', help='只生成合同，不生成概括')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='并行渲染的进程数（默认1）')
+    parser.add_argument('--sheet', help='Excel名单的工作表名称（默认第一个）')
+    parser.add_argument('--cache-dir', help='渲染缓存目录：模板和该行数据都没变的合同直接复用（不指定则不使用缓存）')
+    parser.add_argument('--cache-max-mb', type=int, default=512, help='渲染缓存的容量上限（MB，默认512），超过后淘汰最久未使用的文档')
+    parser.add_argument('--fast', action='store_true', help='模板只含简单的 {{ 变量 }} 时直接替换XML渲染（结果相同，更快）')
+    parser.add_argument('--on-invalid', choices=['skip', 'stop'], help='生成前整表校验：skip 跳过无效行，stop 有无效行时不生成（默认不校验）')
+    parser.add_argument('--checkpoint-dir', help='断点续跑的工作目录：边生成边保存完成的合同，中断后再次运行会跳过已完成的行（写出压缩包后删除）')
+    parser.add_argument('--route', nargs=3, action='append', default=[], metavar=('COLUMN', 'VALUE', 'TEMPLATE'),
+                        help='按行选择模板：COLUMN 列等于 VALUE（不区分大小写）的行使用 TEMPLATE，可重复，先匹配的优先；其余行使用 --template')
+    parser.add_argument('--keep-duplicates', action='store_true', help='不去重：重复的行也各生成一份，同名文件不改名（默认同一邮箱、姓名、账号、月份只生成一次）')
+    parser.add_argument('--history', action='store_true', help='把生成的合同记入合同历史（SQLite），之后可用 history 子命令查询')
+    parser.add_argument('--history-db', help='合同历史数据库（默认 ~/.koc_generator/history.sqlite3）')
+    parser.add_argument('--store-documents', action='store_true', help='合同历史中同时保存 .docx，之后可以直接取回')
+    parser.add_argument('--summary-output', choices=list(OUTPUT_MODES), default='paired', help='概括的输出方式：paired/separate 每人一个文本文件，combined 全部写入一个文本文件（默认paired）')
+    parser.add_argument('--summary-table', choices=['csv', 'xlsx', 'jsonl'], help='另外导出一张每行一条概括的汇总表（姓名、昵称、平台、金额、视频数、上线时间、奖励、付款条件）')
+    parser.add_argument('--chunksize', type=int, help='分块流式读取名单，每块的行数（不指定则整份读取）')
+    return parser
+
+
+def output_stems(paths):
+    """每个名单的输出名（压缩包和断点目录用）：文件名去掉扩展名
+
+    与前面的名单重名时（不同目录的同名文件、同名的 .csv 和 .xlsx）依次加上扩展名、序号，
+    不区分大小写，保证各名单的输出不会互相覆盖。
+    """
+    used = set()
+    stems = []
+    for path in paths:
+        stem, ext = os.path.splitext(os.path.basename(path))
+        candidates = [stem]
+        if ext:
+            candidates.append(f"{stem}_{ext.lstrip('.').lower()}")
+        candidate = next((name for name in candidates if name.lower() not in used), None)
+        number = 2
+        while candidate is None or candidate.lower() in used:
+            candidate = f"{stem}_{number}"
+            number += 1
+        used.add(candidate.lower())
+        stems.append(candidate)
+    return stems
+
+
+def build_history_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m koc_generator history',
+        description='查询合同历史：条件之间为“且”，不给条件时列出最近的合同',
+    )
+    parser.add_argument('--db', help='历史数据库（默认 ~/.koc_generator/history.sqlite3）')
+    parser.add_argument('--email', help='邮箱（精确匹配，不区分大小写）')
+    parser.add_argument('--name', help='乙方姓名（前缀匹配）')
+    parser.add_argument('--username', help='任一平台的账号（可带 @）')
+    parser.add_argument('--month', help='合同月份 YYYY-MM')
+    parser.add_argument('--batch', help='批次号')
+    parser.add_argument('--limit', type=int, default=100, help='最多显示的条数（默认100）')
+    parser.add_argument('--json', action='store_true', help='以 JSON Lines 输出（含 context）')
+    parser.add_argument('--extract', metavar='DIR', help='把查到的合同中保存了 .docx 的写入 DIR')
+    return parser
+
+
+def history_main(argv):
+    args = build_history_parser().parse_args(argv)
+
+    from .history import DEFAULT_HISTORY_PATH, ContractHistory
+
+    with ContractHistory(args.db or DEFAULT_HISTORY_PATH) as history:
+        rows = history.search(args.email, args.name, args.username, args.month, args.batch, args.limit)
+        for row in rows:
+            if args.json:
+                print(json.dumps(dict(row, context=history.context(row['id'])), ensure_ascii=False))
+            else:
+                print(f"{row['id']}\t{row['created_at']}\t{row['month']}\t{row['name']}\t{row['email']}\t{row['filename']}\t{row['content_hash'][:12]}")
+            if args.extract and row['has_document']:
+                filename, data = history.document(row['id'])
+                os.makedirs(args.extract, exist_ok=True)
+                with open(os.path.join(args.extract, f"{row['id']}_{filename}"), 'wb') as fh:
+                    fh.write(data)
+        print(f"{len(rows)} of {len(history)} contracts", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['history']:
+        return history_main(argv[1:])
+    args = build_parser().parse_args(argv)
+
+    # 解析参数后再导入引擎，--help 等不需要加载 pandas/docxtpl
+    from .cache import RenderCache
+    from .checkpoint import Checkpoint
+    from .engine import MissingColumnsError, process_data, process_roster_stream, read_roster
+    from .history import DEFAULT_HISTORY_PATH, ContractHistory
+    from .validation import InvalidRowsError
+    from .render import prewarm_workers
+    from .report import RunReport
+    from .routing import TemplateRouter
+    from .template import CompiledTemplate
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.workers > 1:
+        prewarm_workers()
+    template = CompiledTemplate(args.template, fast_path=args.fast)
+    if args.route:
+        templates = {args.template: template}
+        for _, _, path in args.route:
+            templates.setdefault(path, path)
+        template = TemplateRouter(templates, args.route, default=args.template, fast_path=args.fast)
+    render_cache = RenderCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    history = ContractHistory(args.history_db or DEFAULT_HISTORY_PATH, args.store_documents) if args.history or args.history_db else None
+    failed = 0
+
+    def report_error(message):
+        nonlocal failed
+        failed += 1
+        print(message, file=sys.stderr)
+
+    for csv_path, stem in zip(args.csv, output_stems(args.csv)):
+        report = RunReport(args.workers)
+        if stem != os.path.splitext(os.path.basename(csv_path))[0]:
+            print(f"{csv_path}: another roster has the same file name, writing output as {stem}", file=sys.stderr)
+        checkpoint = Checkpoint(os.path.join(args.checkpoint_dir, stem)) if args.checkpoint_dir else None
+        try:
+            if args.chunksize:
+                archive, summaries, contract_files = process_roster_stream(
+                    csv_path, template, True, not args.contracts_only, OUTPUT_MODES[args.summary_output],
+                    workers=args.workers, chunksize=args.chunksize, sheet_name=args.sheet, on_error=report_error,
+                    render_cache=render_cache, report=report, on_invalid=args.on_invalid, checkpoint=checkpoint, summary_table=args.summary_table,
+                    history=history, dedupe=not args.keep_duplicates,
+                )
+            else:
+                with report.stage('parse'):
+                    df = read_roster(csv_path, args.sheet)
+                archive, summaries, contract_files = process_data(
+                    df, template, True, not args.contracts_only, OUTPUT_MODES[args.summary_output],
+                    workers=args.workers, on_error=report_error, render_cache=render_cache, report=report, on_invalid=args.on_invalid, checkpoint=checkpoint, summary_table=args.summary_table,
+                    history=history, dedupe=not args.keep_duplicates,
+                )
+        except MissingColumnsError as e:
+            report_error(f"{csv_path}: {e}")
+            continue
+        except InvalidRowsError as e:
+            for item in e.errors.itertuples():
+                report_error(f"❌ {item.label} [{item.column}]: {item.error}")
+            report_error(f"{csv_path}: {e}")
+            continue
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        output_path = os.path.join(args.output_dir, f"KOC_Output_{stem}_{date.today().isoformat()}.zip")
+        with archive, open(output_path, 'wb') as fh:
+            shutil.copyfileobj(archive, fh)
+        if checkpoint is not None:
+            # 压缩包写好后工作目录不再需要；失败或中断时保留，下次运行接着生成
+            checkpoint.remove()
+        print(f"{csv_path} -> {output_path} ({len(contract_files)} contracts, {len(summaries)} summaries)")
+        print(f"  {report.rows} rows in {report.elapsed:.2f}s, {report.errors} errors")
+        if report.resumed:
+            print(f"  resumed: {report.resumed} contracts from {checkpoint.directory}")
+        if report.fast_path:
+            print("  fast path: on")
+        if report.templates:
+            print("  templates: " + ", ".join(f"{name} ({rows} rows)" for name, rows in report.templates.items()))
+        if report.cache_hits is not None:
+            print(f"  cache: {report.cache_hits} hits, {report.cache_misses} misses")
+        if report.duplicate_rows:
+            print(f"  duplicates skipped: {len(report.duplicate_rows)}")
+            for item in report.duplicate_rows:
+                print(f"    {item['label']} (same as {item['duplicate_of']})")
+        if report.renamed:
+            print(f"  renamed: {report.renamed} files shared a name with another KOC")
+        if history is not None:
+            print(f"  history: batch {history.batch} in {history.path}")
+
+    if history is not None:
+        history.close()
+
+    return 1 if failed else 0
@@ -0,0 +1,96 @@
+"""渲染前的去重：同一个人同一个月的重复行只生成一次，同名不同人的文件名不会互相覆盖
+
+去重键由规范化后的邮箱、姓名、各平台账号和合同月份组成，按键哈希建索引；
+同一个键再次出现的行在渲染前跳过。合同和概括的文件名由姓名、月份、昵称组成，
+不同的人可能得到相同的文件名，后出现的加上由去重键算出的后缀，重新生成时后缀不变。
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# 参与去重键的平台账号列（与合同中的平台一致）
+HANDLE_COLUMNS = ['TT', 'IG', 'YT', 'FB', 'kwai']
+KEY_SEPARATOR = '\x1f'
+SUFFIX_LENGTH = 6
+
+
+def _normalized(rows, column):
+    if column not in rows.columns:
+        return pd.Series('', index=rows.index, dtype=object)
+    return rows[column].fillna('').astype(str).str.strip().str.lower()
+
+
+def duplicate_keys(rows):
+    """每行的去重键：邮箱、姓名（合并连续空白）、各平台账号（去掉 @）、开始日期的年月
+
+    姓名和邮箱都为空的行没有键（None），不参与去重。
+    """
+    email = _normalized(rows, 'Email')
+    name = _normalized(rows, 'Party B Name').str.replace(r'\s+', ' ', regex=True)
+    parts = [email, name]
+    parts += [_normalized(rows, column).str.lstrip('@') for column in HANDLE_COLUMNS]
+    parts.append(_normalized(rows, 'Start date').str[:7])
+    keys = parts[0]
+    for part in parts[1:]:
+        keys = keys + KEY_SEPARATOR + part
+    return keys.where((email != '') | (name != ''), None).to_numpy(dtype=object)
+
+
+def key_suffix(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:SUFFIX_LENGTH]
+
+
+class DuplicateIndex:
+    """整个压缩包范围内的去重索引，流式读取时跨批保留
+
+    duplicates 为跳过的行 [{'label', 'duplicate_of'}]，renamed 为改过名的文件数。
+    已使用的文件名按小写比较，解压到不区分大小写的文件系统时也不会覆盖。
+    """
+
+    def __init__(self):
+        self.seen = {}
+        self.filenames = set()
+        self.duplicates = []
+        self.renamed = 0
+
+    def drop_duplicates(self, rows, labels):
+        """去掉与之前的行（包括之前的批）重复的行，返回 (行, 标签)"""
+        keys = duplicate_keys(rows)
+        keep = np.ones(len(keys), dtype=bool)
+        for i, (key, label) in enumerate(zip(keys, labels)):
+            if key is None:
+                continue
+            first = self.seen.get(key)
+            if first is None:
+                self.seen[key] = label
+            else:
+                keep[i] = False
+                self.duplicates.append({'label': label, 'duplicate_of': first})
+        if keep.all():
+            return rows, labels
+        return rows[keep], [label for label, kept in zip(labels, keep) if kept]
+
+    def assign_filenames(self, jobs, rows):
+        """为 derive_jobs 的结果分配不重复的合同、概括文件名（jobs 与 rows 行顺序一致）"""
+        keys = duplicate_keys(rows)
+        for job, key in zip(jobs, keys):
+            for field in ('contract_filename', 'summary_filename'):
+                if field in job:
+                    job[field] = self._unique(job[field], key if key is not None else job['label'])
+
+    def _unique(self, filename, key):
+        if filename.lower() not in self.filenames:
+            self.filenames.add(filename.lower())
+            return filename
+        stem, ext = os.path.splitext(filename)
+        candidate = f"{stem}_{key_suffix(key)}{ext}"
+        number = 2
+        while candidate.lower() in self.filenames:
+            candidate = f"{stem}_{key_suffix(key)}_{number}{ext}"
+            number += 1
+        self.filenames.add(candidate.lower())
+        self.renamed += 1
+        return candidate
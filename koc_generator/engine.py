@@ -0,0 +1,789 @@
+"""合同生成引擎：不依赖 Streamlit，可在脚本、定时任务或其他服务中直接调用"""
+
+import calendar
+import codecs
+import logging
+import time
+from contextlib import nullcontext
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from .archive import DEFAULT_SPOOL_THRESHOLD, ArchiveWriter
+from .dedupe import DuplicateIndex
+from .excel import is_excel, iter_excel_frames, read_excel_roster
+from .progress import ProgressTracker
+from .report import RunReport, report_filename
+from .routing import TemplatePool, as_router
+from .summaries import SummaryExporter
+from .validation import STOP_INVALID, InvalidRowsError, drop_invalid_rows, validate_rows
+
+logger = logging.getLogger(__name__)
+
+# 流式读取CSV时每块的行数，以及判断编码用的样本大小
+DEFAULT_CHUNK_ROWS = 2000
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+
+def log_error(message):
+    """默认的错误处理：写入日志"""
+    logger.error(message)
+
+
+def read_roster(csv_file, sheet_name=None):
+    """读取CSV名单（先UTF-8，失败后GBK），并去掉列名首尾空格；Excel名单按 sheet_name 读取"""
+    if is_excel(getattr(csv_file, 'name', csv_file)):
+        return read_excel_roster(csv_file, sheet_name)
+    try:
+        df = pd.read_csv(csv_file, encoding='utf-8', keep_default_na=False, dtype=str)
+    except UnicodeDecodeError:
+        if hasattr(csv_file, 'seek'):
+            csv_file.seek(0)
+        df = pd.read_csv(csv_file, encoding='gbk', keep_default_na=False, dtype=str)
+    df.columns = df.columns.str.strip()
+    return df
+
+
+# 平台字段：列名 -> 平台名称 / 用户名标签 / 主页链接
+PLATFORM_NAMES = {
+    'TT': 'TikTok',
+    'IG': 'Instagram',
+    'YT': 'YouTube',
+    'FB': 'Facebook',
+    'kwai': 'Kwai'
+}
+PLATFORM_USERNAME_LABELS = {
+    'TT': 'Tiktok Video',
+    'IG': 'Instagram Reels',
+    'YT': 'YouTube Shorts',
+    'FB': 'Facebook Reels',
+    'kwai': 'Kwai Video'
+}
+PLATFORM_LINKS = {
+    'TT': 'https://www.tiktok.com/@{}',
+    'IG': 'https://www.instagram.com/{}',
+    'YT': 'https://www.youtube.com/@{}',
+    'FB': 'https://www.facebook.com/{}',
+    'kwai': 'https://www.kwai.com/user/{}'
+}
+
+BONUS_INFO = {
+    'lower': """*The bonuses will be paid with basic video production fee.\n\nBonus Payment Policy:\n\n*One video will only get the bonus once in the limited time. Pay the bonus with the highest amount.\n\nBonus per video reaches 100k views in 3 days from the date of posting, USD[15.00].\nBonus per video reaches 200k views in 3 days from the date of posting, USD[20.00].\nBonus per video reaches 300k views in 3 days from the date of posting, USD[30.00].\nBonus per video reaches 500k views in 3 days from the date of posting, USD[45.00].\nBonus per video reaches 1M views in 3 days from the date of posting, USD[65.00].\n\nTotal Budget up to $1500.""",
+    'higher': """*The bonuses will be paid with basic video production fee.\n\nBonus Payment Policy:\n\n*One video will only get the bonus once in the limited time. Pay the bonus with the highest amount.\n\nBonus per video reaches 100k views in 3 days from the date of posting, USD[30.00].\nBonus per video reaches 200k views in 3 days from the date of posting, USD[40.00].\nBonus per video reaches 300k views in 3 days from the date of posting, USD[60.00].\nBonus per video reaches 500k views in 3 days from the date of posting, USD[90.00].\nBonus per video reaches 1M views in 3 days from the date of posting, USD[110.00].\n\nTotal Budget up to $1500."""
+}
+
+PAYMENT_CHARGES = {
+    'bank': "Payment charges shall be borne by each party independently (SHA).",
+    'paypal': "Party A processing fee with 2% of total payments shall be deducted in advance."
+}
+
+# 概括中的付款条件与奖励说明
+SUMMARY_PAYMENT_TEXT = {
+    'bank': "银行转账，手续费共同承担，视频上线后 Net 30 days/video。",
+    'paypal': "PayPal转账，手续费对方承担，预先扣除2%，视频上线后 Net 30 days/video。"
+}
+SUMMARY_DEFAULT_PAYMENT_TEXT = "视频上线后 Net 30 days/video。"
+SUMMARY_BONUS_TEXT = "\n3. 有奖励机制，合同中有根据播放量制定的详细奖励机制，具体参见合同。"
+SUMMARY_RIGHTS_TEXT = "权利义务：(重点highlight)\n1. 未经甲方同意，乙方不得删除视频，内容永久保留，否则支付甲方50%的费用。\n2. 乙方发布未经批准/错误版本视频，甲方可以选择补偿方式（删除重发、另行协商补偿、终止合作拒绝付款）。"
+
+
+def generate_contract_summary(row):
+    """生成合同基本内容概括 - 使用中文字段"""
+    try:
+        kol_name = str(row.get('Party B Name', '')).strip()
+        nickname = str(row.get('Main Platform nickname', '')).strip()
+        video_rate = str(row.get('Video Rate', '')).strip()
+        video_number = str(row.get('Estimated Videos', '')).strip()
+        statement = str(row.get('Statement', '')).strip()
+        actual_video_number = str(row.get('No. of Posted Videos', '')).strip()
+        bonus = str(row.get('Bonus', '')).strip().lower()
+
+        # 获取平台信息 - 从各个平台字段组合
+        platform_fields = infer_platform_fields(row)
+        platforms = platform_fields['platform']
+
+        # 获取日期信息 - 使用infer_chinese_date_versions函数（用于中文摘要）
+        date_fields = infer_chinese_date_versions(row)
+        promotion_date = date_fields['promotion_date']
+
+        # 获取支付信息
+        payment_method = str(row.get('Payment method', '')).strip()
+        payment_text = SUMMARY_PAYMENT_TEXT.get(payment_method.lower(), SUMMARY_DEFAULT_PAYMENT_TEXT)
+
+        video_rate_clean = format_summary_video_rate(video_rate)
+
+        # 奖励机制：根据bonus字段判断
+        bonus_text = ""
+        if bonus in ['lower', 'higher']:
+            bonus_text = SUMMARY_BONUS_TEXT
+
+        koc_display_name = nickname if nickname else kol_name
+
+        # 根据statement判断履行状态，选择不同的时间表述
+        if statement == "已履行完毕":
+            line2 = f"2. 单支视频金额${video_rate_clean}，签约 {video_number} 期视频，实际上线视频数量为 {actual_video_number} 支，视频上线时间为 {promotion_date}。"
+        else:
+            line2 = f"2. 单支视频金额${video_rate_clean}，签约 {video_number} 期视频，视频预计上线时间为 {promotion_date}。"
+        
+        summary = f'''合作事项：\n1. 海外KOC（{koc_display_name}），发布平台{platforms}。\n{line2}{bonus_text}\n\n{SUMMARY_RIGHTS_TEXT}\n\n付款条件：\n{payment_text}'''
+        return summary
+    except Exception as e:
+        return f"生成概括时出错: {str(e)}"
+
+
+def infer_platform_fields(row):
+    platforms = []
+    usernames = []
+    links = []
+    for key in PLATFORM_NAMES:
+        uname = str(row.get(key, '')).strip()
+        if uname:
+            platforms.append(PLATFORM_NAMES[key])
+            usernames.append(f"{PLATFORM_USERNAME_LABELS[key]} - {uname}")
+            links.append(PLATFORM_LINKS[key].format(uname))
+    return {
+        'platform': ' ＆ '.join(platforms),
+        'platform_username': '\n'.join(usernames),
+        'Influencer_links': '\n'.join(links)
+    }
+
+
+def infer_date_versions(row):
+    start = row.get('Start date', '')
+    end = row.get('end date', '')
+    try:
+        start_dt = datetime.strptime(start, '%Y-%m-%d')
+        if end and str(end).strip():  # 检查end date是否为空
+            end_dt = datetime.strptime(end, '%Y-%m-%d')
+            if start_dt.year == end_dt.year and start_dt.month == end_dt.month:
+                english = f"{calendar.month_name[start_dt.month]} {start_dt.year}"
+            else:
+                english = f"{calendar.month_name[start_dt.month]} {start_dt.year} - {calendar.month_name[end_dt.month]} {end_dt.year}"
+        else:
+            # 如果end date为空，只显示开始日期
+            english = f"{calendar.month_name[start_dt.month]} {start_dt.year}"
+    except Exception as e:
+        logger.warning(f"Date parsing error: {e}, start: {start}, end: {end}")
+        english = ""
+    return {
+        'promotion_date': english
+    }
+
+
+def infer_chinese_date_versions(row):
+    start = row.get('Start date', '')
+    end = row.get('end date', '')
+    try:
+        start_dt = datetime.strptime(start, '%Y-%m-%d')
+        if end and str(end).strip():  # 检查end date是否为空
+            end_dt = datetime.strptime(end, '%Y-%m-%d')
+            if start_dt.year == end_dt.year and start_dt.month == end_dt.month:
+                chinese = f"{start_dt.year}年{start_dt.month:02d}月"
+            else:
+                chinese = f"{start_dt.year}年{start_dt.month:02d}月 - {end_dt.year}年{end_dt.month:02d}月"
+        else:
+            # 如果end date为空，只显示开始日期
+            chinese = f"{start_dt.year}年{start_dt.month:02d}月"
+    except Exception as e:
+        logger.warning(f"Date parsing error: {e}, start: {start}, end: {end}")
+        chinese = ""
+    return {
+        'promotion_date': chinese
+    }
+
+
+def infer_bonus_info(row):
+    bonus = str(row.get('Bonus', 'none')).strip().lower()
+    # 处理不同的bonus值格式
+    return {'bonus_info': BONUS_INFO.get(bonus, '')}
+
+
+def infer_payment_fields(row):
+    method = str(row.get('Payment method', '')).strip().lower()
+    return {'payment_charges': PAYMENT_CHARGES.get(method, '')}
+
+
+def format_video_rate(value):
+    """合同中的单支视频金额（两位小数），空值为空字符串"""
+    try:
+        is_video_rate_empty = bool(pd.isna(value)) or str(value).strip() == ""
+    except Exception:
+        is_video_rate_empty = str(value).strip() == ""
+    return "{:.2f}".format(float(value)) if not is_video_rate_empty else ""
+
+
+def format_summary_video_rate(video_rate):
+    """概括中的单支视频金额（取整），无法解析时原样返回"""
+    try:
+        return "{:.0f}".format(float(video_rate)) if video_rate else "0"
+    except:
+        return video_rate
+
+
+def contract_month(start_date):
+    """合同文件名中的月份（YYYY-MM）"""
+    return datetime.strptime(str(start_date).strip(), '%Y-%m-%d').strftime('%Y-%m')
+
+
+# ---- 批量推导：按列一次算出整张表的 context 和概括字段 ----
+
+def _raw(df, column, default=''):
+    """列的原始值；列不存在时等同于 row.get(column, default)"""
+    if column in df.columns:
+        return df[column]
+    return pd.Series(default, index=df.index, dtype=object)
+
+
+def _text(df, column, default=''):
+    """等同于逐行的 str(row.get(column, default))"""
+    return _raw(df, column, default).astype(str)
+
+
+def _map_distinct(values, func):
+    """每个不同的值只计算一次，返回 (结果列表, 异常列表)"""
+    results = {}
+    for value in set(values):
+        try:
+            results[value] = (func(value), None)
+        except Exception as e:
+            results[value] = (None, e)
+    mapped = [results[value] for value in values]
+    return [result for result, _ in mapped], [error for _, error in mapped]
+
+
+def _append(joined, mask, text, sep):
+    """在 mask 为真的行上把 text 以 sep 连接到 joined 后面"""
+    return joined + np.where(mask & (joined != ''), sep, '') + np.where(mask, text, '')
+
+
+def _records(columns):
+    """列字典 -> 每行一个字典（比 DataFrame.to_dict('records') 快，值保持为 Python 对象）"""
+    keys = list(columns)
+    values = [column.tolist() if hasattr(column, 'tolist') else list(column) for column in columns.values()]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def derive_platform_columns(df):
+    """按列计算 platform / platform_username / Influencer_links"""
+    empty = pd.Series('', index=df.index, dtype=object)
+    platform, usernames, links = empty, empty, empty
+    for key in PLATFORM_NAMES:
+        uname = _text(df, key).str.strip()
+        mask = (uname != '').to_numpy()
+        platform = _append(platform, mask, PLATFORM_NAMES[key], ' ＆ ')
+        usernames = _append(usernames, mask, PLATFORM_USERNAME_LABELS[key] + ' - ' + uname, '\n')
+        links = _append(links, mask, uname.map(PLATFORM_LINKS[key].format), '\n')
+    return platform, usernames, links
+
+
+def _date_pairs(df, infer):
+    start = _raw(df, 'Start date').tolist()
+    end = _raw(df, 'end date').tolist()
+    values, _ = _map_distinct(
+        list(zip(start, end)),
+        lambda pair: infer({'Start date': pair[0], 'end date': pair[1]})['promotion_date'],
+    )
+    return pd.Series(values, index=df.index, dtype=object)
+
+
+# 合同 context 的字段，以及计算各字段必须有的名单列（其余字段缺列时按空值处理）
+CONTEXT_FIELDS = [
+    'Influencer_name', 'Influencer_email', 'Influencer_contact', 'Influencer_address',
+    'platform', 'platform_username', 'Influencer_links', 'promotion_date', 'video_rate',
+    'video_number', 'bonus_info', 'payment_method', 'payment_information', 'payment_charges',
+]
+CONTEXT_COLUMNS = {
+    'Influencer_email': ['Email'],
+    'Influencer_contact': ['Contact'],
+    'Influencer_address': ['Address'],
+    'video_rate': ['Video Rate'],
+    'video_number': ['Estimated Videos'],
+    'payment_method': ['Payment method'],
+    'payment_information': ['Payment Info'],
+}
+# 合同文件名总是需要的列
+CONTRACT_COLUMNS = ['Party B Name', 'Start date']
+PLATFORM_FIELDS = {'platform', 'platform_username', 'Influencer_links'}
+
+
+class MissingColumnsError(ValueError):
+    """名单缺少模板需要的列；在渲染任何一行之前抛出"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        super().__init__(f"名单缺少模板需要的列：{', '.join(columns)}")
+
+
+def context_fields(variables=None):
+    """模板用到的 context 字段；variables 为 None（未知）时为全部字段"""
+    return [field for field in CONTEXT_FIELDS if variables is None or field in variables]
+
+
+def required_columns(variables=None):
+    """生成合同必须有的名单列"""
+    columns = list(CONTRACT_COLUMNS)
+    for field in context_fields(variables):
+        columns.extend(column for column in CONTEXT_COLUMNS.get(field, []) if column not in columns)
+    return columns
+
+
+def missing_columns(df, variables=None):
+    return [column for column in required_columns(variables) if column not in df.columns]
+
+
+def derive_jobs(df, labels, generate_contracts, generate_summaries, variables=None, summary_fields=False, history_fields=False):
+    """一次性为整张表推导每行的渲染任务
+
+    返回与 df 行顺序一致的字典列表：合同 context、文件名、概括文本等，
+    出错的行带 'error'（与逐行处理时抛出的异常一致），不会被渲染。
+    传入模板的变量集合 variables 时，context 只包含并只计算模板用到的字段。
+    summary_fields 为 True 时每行另带 'summary_fields'（汇总表的一行，见 summaries.SUMMARY_FIELDS）；
+    history_fields 为 True 时每行另带 'history_fields'（合同历史的索引字段，见 history.ContractHistory）。
+    """
+    name = _raw(df, 'Party B Name')
+    name_text = name.astype(str)
+    jobs = [{'label': label} for label in labels]
+    if not jobs:
+        return jobs
+
+    fields = context_fields(variables) if generate_contracts else []
+    if generate_summaries or history_fields or PLATFORM_FIELDS.intersection(fields):
+        platform, usernames, links = derive_platform_columns(df)
+
+    if generate_contracts:
+        # 与逐行构建 context 时的求值顺序一致：先缺列，再金额，再缺列，最后开始日期
+        required = required_columns(variables)
+        missing_before_rate = [column for column in ['Party B Name', 'Email', 'Contact', 'Address'] if column in required and column not in df.columns]
+        missing_after_rate = [column for column in ['Estimated Videos', 'Payment method', 'Payment Info'] if column in required and column not in df.columns]
+        if 'video_rate' in fields:
+            video_rates, rate_errors = _map_distinct(_raw(df, 'Video Rate').tolist(), format_video_rate)
+        else:
+            rate_errors = [None] * len(jobs)
+        months, month_errors = _map_distinct(_raw(df, 'Start date').tolist(), contract_month)
+        if not missing_before_rate + missing_after_rate:
+            def contact():
+                column = df['Contact']
+                return column.where(~(column.isna() | (column.astype(str).str.strip() == '')), 'N/A')
+
+            derivations = {
+                'Influencer_name': lambda: name,
+                'Influencer_email': lambda: df['Email'],
+                'Influencer_contact': contact,
+                'Influencer_address': lambda: df['Address'],
+                'platform': lambda: platform,
+                'platform_username': lambda: usernames,
+                'Influencer_links': lambda: links,
+                'promotion_date': lambda: _date_pairs(df, infer_date_versions),
+                'video_rate': lambda: video_rates,
+                'video_number': lambda: df['Estimated Videos'],
+                'bonus_info': lambda: _text(df, 'Bonus', 'none').str.strip().str.lower().map(BONUS_INFO).fillna(''),
+                'payment_method': lambda: df['Payment method'],
+                'payment_information': lambda: df['Payment Info'],
+                'payment_charges': lambda: _text(df, 'Payment method').str.strip().str.lower().map(PAYMENT_CHARGES).fillna(''),
+            }
+            columns = {field: derivations[field]() for field in fields}
+            contexts = _records(columns) if columns else [{} for _ in jobs]
+        names = name_text.tolist()
+        if history_fields:
+            emails = _text(df, 'Email').str.strip().tolist()
+            handles = list(zip(*[_text(df, key).str.strip().tolist() for key in PLATFORM_NAMES]))
+            display_usernames = usernames.tolist()
+        for i, job in enumerate(jobs):
+            if missing_before_rate:
+                job['error'] = KeyError(missing_before_rate[0])
+            elif rate_errors[i] is not None:
+                job['error'] = rate_errors[i]
+            elif missing_after_rate:
+                job['error'] = KeyError(missing_after_rate[0])
+            elif month_errors[i] is not None:
+                job['error'] = month_errors[i]
+            else:
+                job['context'] = contexts[i]
+                job['contract_filename'] = f'FW-ARETIS & {names[i]}_{months[i]}.docx'
+                if history_fields:
+                    job['history_fields'] = {
+                        'name': names[i].strip(),
+                        'email': emails[i],
+                        'platform_username': display_usernames[i],
+                        'handles': [handle for handle in handles[i] if handle],
+                        'month': months[i],
+                    }
+
+    if generate_summaries:
+        kol_name = name_text.str.strip()
+        nickname = _text(df, 'Main Platform nickname').str.strip()
+        summary_rates, _ = _map_distinct(_text(df, 'Video Rate').str.strip().tolist(), format_summary_video_rate)
+        summary_rates = pd.Series(summary_rates, index=df.index, dtype=object)
+        video_number = _text(df, 'Estimated Videos').str.strip()
+        promotion_date = _date_pairs(df, infer_chinese_date_versions)
+        statement = _text(df, 'Statement').str.strip()
+        finished = (statement == "已履行完毕").to_numpy()
+        actual_video_number = _text(df, 'No. of Posted Videos').str.strip()
+        has_bonus = _text(df, 'Bonus').str.strip().str.lower().isin(['lower', 'higher']).to_numpy()
+        bonus_text = np.where(has_bonus, SUMMARY_BONUS_TEXT, '')
+        payment_text = _text(df, 'Payment method').str.strip().str.lower().map(SUMMARY_PAYMENT_TEXT).fillna(SUMMARY_DEFAULT_PAYMENT_TEXT)
+        display_name = nickname.where(nickname != '', kol_name)
+        rate_part = "2. 单支视频金额$" + summary_rates + "，签约 " + video_number + " 期视频，"
+        line2 = rate_part + np.where(
+            finished,
+            "实际上线视频数量为 " + actual_video_number + " 支，视频上线时间为 " + promotion_date + "。",
+            "视频预计上线时间为 " + promotion_date + "。"
+        )
+        summaries = ("合作事项：\n1. 海外KOC（" + display_name + "），发布平台" + platform + "。\n" + line2 + bonus_text
+                     + "\n\n" + SUMMARY_RIGHTS_TEXT + "\n\n付款条件：\n" + payment_text).tolist()
+        safe_names = name_text.str.replace(" ", "_", regex=False).str.replace("/", "-", regex=False).tolist()
+        summary_filenames = (name_text + "_" + nickname + "_summary.txt").tolist()
+        kol_names = kol_name.tolist()
+        for i, job in enumerate(jobs):
+            job['summary'] = summaries[i]
+            job['summary_name'] = kol_names[i]
+            job['safe_name'] = safe_names[i]
+            job['summary_filename'] = summary_filenames[i]
+        if summary_fields:
+            rows = _records({
+                'name': kol_name,
+                'nickname': nickname,
+                'platforms': platform,
+                'video_rate': summary_rates,
+                'video_number': video_number,
+                'promotion_date': promotion_date,
+                'status': statement,
+                'posted_videos': actual_video_number,
+                'bonus': has_bonus,
+                'payment_terms': payment_text,
+            })
+            for job, row in zip(jobs, rows):
+                job['summary_fields'] = row
+    return jobs
+
+
+def write_jobs(zip_file, jobs, renderer, generate_contracts, generate_summaries, output_mode, *, on_error=log_error, report=None, progress=None, checkpoint=None, exporter=None, history=None):
+    """渲染合同（可并行）并按原始行顺序写入压缩包
+
+    传入 report 时记录每行的耗时和出错的行，传入 progress（ProgressTracker）时逐行推进进度。
+    传入 checkpoint（Checkpoint）时，工作目录中已完成的行直接取用，新完成的合同随即写入。
+    传入 exporter（SummaryExporter）时，每行的概括随即追加到合并文本和汇总表。
+    传入 history（ContractHistory）时，写入压缩包的每份合同都记入合同历史。
+    """
+    today = date.today().isoformat()
+    summaries = []
+    contract_files = []
+    rendered = None
+    if generate_contracts:
+        if checkpoint is not None:
+            # 渲染前一次性决定哪些行从工作目录取用；循环中 record() 会改变 done，
+            # context 相同的两行（模板只用到部分字段、不去重时）不能因此错位
+            for job in jobs:
+                if 'error' not in job:
+                    job['checkpoint_key'] = checkpoint.key(job['context'])
+                    job['resumed'] = job['checkpoint_key'] in checkpoint.done
+        contexts = [job['context'] for job in jobs if 'error' not in job and not job.get('resumed')]
+        rendered = renderer.render(contexts, timings=True)
+    for job in jobs:
+        timings = {}
+        failed = False
+        result = None
+        if generate_contracts and 'error' not in job and not job.get('resumed'):
+            # 在逐行的 try 之外取结果：进程池失败（工作进程退出、缓存写入出错）时渲染会整体中止，
+            # 应让整批失败，而不是把之后的每一行都记为出错
+            result = next(rendered)
+        try:
+            if 'error' in job:
+                raise job['error']
+            if generate_contracts:
+                if job.get('resumed'):
+                    doc_bytes = checkpoint.contract(job['checkpoint_key'])
+                else:
+                    doc_bytes, render_error, timings = result
+                    if render_error is not None:
+                        raise RuntimeError(render_error)
+                    if checkpoint is not None:
+                        checkpoint.record(job['checkpoint_key'], doc_bytes)
+                contract_files.append(job['contract_filename'])
+                start = time.perf_counter()
+                zip_file.writestr(job['contract_filename'], doc_bytes)
+                timings['writestr'] = time.perf_counter() - start
+                if history is not None:
+                    history.record(job['contract_filename'], job['history_fields'], job['context'], doc_bytes)
+            if generate_summaries:
+                summaries.append({
+                    'name': job['summary_name'],
+                    'summary': job['summary'],
+                    'filename': f"Summary_{job['safe_name']}_{today}.txt"
+                })
+                if exporter is not None:
+                    exporter.add(job['summary_name'], job['summary'], job.get('summary_fields'))
+                if output_mode in ["配对输出", "单独文件"]:
+                    start = time.perf_counter()
+                    zip_file.writestr(job['summary_filename'], job['summary'])
+                    timings['writestr'] = timings.get('writestr', 0.0) + time.perf_counter() - start
+        except Exception as e:
+            failed = True
+            on_error(f"❌ Error processing {job['label']}: {e}")
+            if report is not None:
+                report.add_error(job['label'], e)
+        if report is not None:
+            report.add_row(job['label'], timings)
+        if progress is not None:
+            progress.advance(1, int(failed))
+    if rendered is not None and next(rendered, None) is not None:
+        # 渲染结果与行按顺序一一对应，有剩余说明之后的合同都写给了错误的行
+        raise RuntimeError("Rendered contracts do not match the rows they were rendered for")
+    if checkpoint is not None:
+        checkpoint.sync()
+    if history is not None:
+        history.sync()
+    return summaries, contract_files
+
+
+def summary_exporter(generate_summaries, output_mode, summary_table=None):
+    """合并文件模式或需要汇总表时的 SummaryExporter，否则为 None"""
+    combined = output_mode == "合并文件"
+    if not generate_summaries or not (combined or summary_table):
+        return None
+    return SummaryExporter(combined, summary_table)
+
+
+def generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers=1, *, spool_threshold=DEFAULT_SPOOL_THRESHOLD, on_error=log_error, render_cache=None, report=None, on_progress=None, on_invalid=None, checkpoint=None, summary_table=None, history=None, dedupe=True):
+    """逐批推导、渲染并写入压缩包；batches 为 (行, 错误提示用的标签) 的可迭代对象
+
+    传入 render_cache（RenderCache）时，context 与模板都没有变化的合同直接取用缓存。
+    传入 report（RunReport）时记录各阶段耗时，并把报告以 JSON 写入压缩包；
+    on_progress 按时间节流地收到进度字典（见 ProgressTracker）。
+    on_invalid 为 SKIP_INVALID / STOP_INVALID 时，每批在渲染前先整表校验（见 validation），
+    无效行跳过并记为出错，或抛出 InvalidRowsError；流式读取时按块校验。
+    传入 checkpoint（Checkpoint）时边生成边保存完成的合同，中断后重新生成会跳过已完成的行。
+    生成概括时，summary_table（'csv' / 'xlsx' / 'jsonl'）另写一张汇总表；
+    合并文件模式和汇总表都随行写入临时文件，不在内存中拼接。
+    uploaded_template 可以是 TemplateRouter：每批按规则把行分给不同的模板，各组分别渲染，
+    全部写入同一个压缩包（组内保持行顺序）。
+    传入 history（ContractHistory）时，本次生成的合同记入合同历史（同一个批次号）；
+    生成失败（包括流式读取改用GBK重新生成）时删除本次已写入的记录。
+    dedupe 为 True 时在渲染前去重（见 dedupe）：同一个人同一个月的重复行跳过，
+    同名不同人的合同、概括文件名加上固定的后缀；跳过和改名的情况记入 report。
+    """
+    write_report = report is not None
+    if report is None:
+        report = RunReport(workers)
+    report.track_cache(render_cache)
+    # 整份读取时行数已知，可以估算剩余时间；流式读取时只报告已处理行数和速度
+    total = sum(len(rows) for rows, _ in batches) if isinstance(batches, list) else None
+    progress = ProgressTracker(on_progress, total)
+
+    # 每个模板只解析一次，每行从干净副本渲染
+    router = as_router(uploaded_template)
+    if len(router.templates) > 1:
+        report.templates = {name: 0 for name in router.templates}
+    exporter = summary_exporter(generate_summaries, output_mode, summary_table)
+    record_history = history is not None and generate_contracts
+    duplicates = DuplicateIndex() if dedupe else None
+    summaries = []
+    contract_files = []
+    # 条目直接写入临时文件，超过 spool_threshold 后落盘
+    with ArchiveWriter(spool_threshold) as zip_file, TemplatePool(router, workers, render_cache) as pool, \
+            (history.recording() if record_history else nullcontext()):
+        if generate_contracts:
+            # 默认模板在读取名单前解析，模板本身有问题时立即报错
+            pool.get(router.default)
+        batches = iter(batches)
+        while True:
+            # 流式读取时，取下一批的时间就是解析这一块CSV的时间
+            with report.stage('parse'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            rows, labels = batch
+            if generate_contracts:
+                # 缺少模板需要的列时在校验前整体报错，而不是每行各报一次 KeyError；
+                # 这里只用已编译过的模板的变量，不为检查而编译（超过池的上限时会被淘汰、重复编译），
+                # 第一次用到的模板在渲染该组前检查
+                for name in pd.unique(router.route(rows)) if len(rows) else [router.default]:
+                    try:
+                        variables = pool.known_variables(name)
+                    except KeyError:
+                        continue
+                    missing = missing_columns(rows, variables)
+                    if missing:
+                        raise MissingColumnsError(missing)
+            if on_invalid is not None:
+                rows, labels = _apply_validation(rows, labels, on_invalid, on_error, report, progress)
+            if duplicates is not None:
+                with report.stage('validate'):
+                    kept = len(rows)
+                    rows, labels = duplicates.drop_duplicates(rows, labels)
+                progress.advance(kept - len(rows))
+            groups = router.split(rows, labels) if generate_contracts else [(None, rows, labels)]
+            for name, group_rows, group_labels in groups:
+                template, renderer = pool.get(name) if name is not None else (None, None)
+                # 只计算模板用到的 context 字段；模板无法分析时按完整 context
+                variables = template.undeclared_variables() if template is not None else None
+                if template is not None:
+                    missing = missing_columns(group_rows, variables)
+                    if missing:
+                        raise MissingColumnsError(missing)
+                    report.fast_path = report.fast_path or template.fast is not None
+                    if checkpoint is not None:
+                        checkpoint.start(template)
+                    if record_history:
+                        history.start(template)
+                if report.templates is not None and name is not None:
+                    report.templates[name] += len(group_rows)
+                with report.stage('derive'):
+                    jobs = derive_jobs(group_rows, group_labels, generate_contracts, generate_summaries, variables,
+                                       summary_fields=exporter is not None and exporter.wants_fields, history_fields=record_history)
+                    if duplicates is not None:
+                        duplicates.assign_filenames(jobs, group_rows)
+                batch_summaries, batch_files = write_jobs(zip_file, jobs, renderer, generate_contracts, generate_summaries, output_mode,
+                                                          on_error=on_error, report=report, progress=progress, checkpoint=checkpoint, exporter=exporter,
+                                                          history=history if record_history else None)
+                summaries.extend(batch_summaries)
+                contract_files.extend(batch_files)
+        if exporter is not None:
+            exporter.write_to(zip_file)
+        if checkpoint is not None:
+            report.resumed = checkpoint.resumed
+        if duplicates is not None:
+            report.duplicate_rows = duplicates.duplicates
+            report.renamed = duplicates.renamed
+        report.finish(len(contract_files), len(summaries))
+        progress.finish()
+        if write_report:
+            zip_file.writestr(report_filename(), report.to_json())
+    return zip_file.download_data(), summaries, contract_files
+
+
+def _apply_validation(rows, labels, on_invalid, on_error, report, progress):
+    """整表校验一批行：STOP_INVALID 时有无效行就抛出 InvalidRowsError，否则跳过无效行并记为出错"""
+    with report.stage('validate'):
+        errors = validate_rows(rows, labels)
+    if errors.empty:
+        return rows, labels
+    if on_invalid == STOP_INVALID:
+        raise InvalidRowsError(errors)
+    for label, messages in errors.groupby('label', sort=False)['error']:
+        message = '；'.join(messages)
+        on_error(f"⚠️ Skipped {label}: {message}")
+        report.add_error(label, message)
+    skipped = errors['row'].nunique()
+    progress.advance(skipped, skipped)
+    return drop_invalid_rows(rows, labels, errors)
+
+
+def _label_rows(rows):
+    return (rows['Party B Name'].astype(str) + " (row " + rows.index.astype(str) + ")").tolist()
+
+
+def select_roster_rows(df):
+    """选出需要处理的行：跳过前两行说明行，以及姓名为空的行；返回 (行, 错误提示用的标签)"""
+    has_name = (df['Party B Name'].astype(str).str.strip() != '').to_numpy()
+    valid_positions = has_name.nonzero()[0]
+    last_valid_index = valid_positions[-1] if len(valid_positions) > 0 else -1
+    rows = df.iloc[2:last_valid_index+1]
+    rows = rows[has_name[2:last_valid_index+1]]
+    return rows, _label_rows(rows)
+
+
+def records_to_frame(form_records):
+    """把表单记录（字典列表）转为 DataFrame，缺少的字段为空字符串"""
+    return pd.DataFrame(form_records).fillna('')
+
+
+def process_data(df, uploaded_template, generate_contracts, generate_summaries, output_mode, workers=1, *, spool_threshold=DEFAULT_SPOOL_THRESHOLD, on_error=log_error, render_cache=None, report=None, on_progress=None, on_invalid=None, checkpoint=None, summary_table=None, history=None, dedupe=True):
+    """处理CSV名单数据（前两行为说明行，跳过）"""
+    batches = [select_roster_rows(df)]
+    return generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers,
+                            spool_threshold=spool_threshold, on_error=on_error, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
+
+
+def process_form_data(form_records, uploaded_template, generate_contracts, generate_summaries, output_mode, workers=1, *, spool_threshold=DEFAULT_SPOOL_THRESHOLD, on_error=log_error, render_cache=None, report=None, on_progress=None, on_invalid=None, checkpoint=None, summary_table=None, history=None, dedupe=True):
+    """处理表单数据"""
+    rows = records_to_frame(form_records)
+    batches = [(rows, _text(rows, 'Party B Name', 'Unknown').tolist())]
+    return generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers,
+                            spool_threshold=spool_threshold, on_error=on_error, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
+
+
+# ---- 流式读取：分块解析CSV，边读边生成 ----
+
+def _rewind(csv_file):
+    if hasattr(csv_file, 'seek'):
+        csv_file.seek(0)
+
+
+def detect_encoding(csv_file, sample_size=ENCODING_SAMPLE_BYTES):
+    """根据文件开头的样本判断编码：能按UTF-8解码为UTF-8，否则为GBK"""
+    if hasattr(csv_file, 'read'):
+        _rewind(csv_file)
+        sample = csv_file.read(sample_size)
+        _rewind(csv_file)
+    else:
+        with open(csv_file, 'rb') as fh:
+            sample = fh.read(sample_size)
+    try:
+        # final=False：样本末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+
+def _roster_batches(frames):
+    """把逐块读取的名单按 select_roster_rows 的规则逐块产出 (行, 标签)"""
+    for chunk in frames:
+        # 各块的行号是连续的，行号 0、1 为说明行；末尾的空姓名行与中间的一样跳过
+        has_name = (chunk['Party B Name'].astype(str).str.strip() != '').to_numpy()
+        rows = chunk[has_name & (chunk.index >= 2)]
+        yield rows, _label_rows(rows)
+
+
+def iter_roster_chunks(csv_file, encoding, chunksize=DEFAULT_CHUNK_ROWS):
+    """分块读取CSV名单，逐块产出 (行, 标签)"""
+    reader = pd.read_csv(csv_file, encoding=encoding, keep_default_na=False, dtype=str, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield from _roster_batches([chunk])
+
+
+def process_csv_stream(csv_file, uploaded_template, generate_contracts, generate_summaries, output_mode, workers=1, *, spool_threshold=DEFAULT_SPOOL_THRESHOLD, chunksize=DEFAULT_CHUNK_ROWS, on_error=log_error, render_cache=None, report=None, on_progress=None, on_invalid=None, checkpoint=None, summary_table=None, history=None, dedupe=True):
+    """流式处理CSV名单：分块读取并立即生成，结果与 read_roster + process_data 相同"""
+    encoding = detect_encoding(csv_file)
+    reported = []
+
+    def report_first(message):
+        reported.append(message)
+        on_error(message)
+
+    try:
+        batches = iter_roster_chunks(csv_file, encoding, chunksize)
+        return generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers,
+                                spool_threshold=spool_threshold, on_error=report_first, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
+    except UnicodeDecodeError:
+        if encoding != 'utf-8':
+            raise
+    # 样本之后才出现非UTF-8内容：与 read_roster 一样整份改用GBK重新生成，已报告过的错误不再重复
+    logger.warning("CSV is not valid UTF-8 beyond the encoding sample, regenerating with GBK")
+
+    def report_new(message):
+        if message in reported:
+            reported.remove(message)
+        else:
+            on_error(message)
+
+    _rewind(csv_file)
+    if report is not None:
+        report.reset()
+    batches = iter_roster_chunks(csv_file, 'gbk', chunksize)
+    return generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers,
+                            spool_threshold=spool_threshold, on_error=report_new, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
+
+
+def process_roster_stream(roster_file, uploaded_template, generate_contracts, generate_summaries, output_mode, workers=1, *, spool_threshold=DEFAULT_SPOOL_THRESHOLD, chunksize=DEFAULT_CHUNK_ROWS, sheet_name=None, on_error=log_error, render_cache=None, report=None, on_progress=None, on_invalid=None, checkpoint=None, summary_table=None, history=None, dedupe=True):
+    """流式处理CSV或Excel名单；Excel用只读模式逐行读取，不会整表载入内存"""
+    if not is_excel(getattr(roster_file, 'name', roster_file)):
+        return process_csv_stream(roster_file, uploaded_template, generate_contracts, generate_summaries, output_mode, workers, chunksize=chunksize,
+                                  spool_threshold=spool_threshold, on_error=on_error, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
+    batches = _roster_batches(iter_excel_frames(roster_file, sheet_name, chunksize))
+    return generate_archive(batches, uploaded_template, generate_contracts, generate_summaries, output_mode, workers,
+                            spool_threshold=spool_threshold, on_error=on_error, render_cache=render_cache, report=report, on_progress=on_progress, on_invalid=on_invalid, checkpoint=checkpoint, summary_table=summary_table, history=history, dedupe=dedupe)
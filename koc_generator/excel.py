@@ -0,0 +1,140 @@
+"""Excel名单读取：.xlsx 用 openpyxl 只读模式逐行流式读取，.xls 用 xlrd"""
+
+import os
+from datetime import date, datetime, time
+
+import pandas as pd
+
+from .inputs import read_file_bytes
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+
+
+def is_excel(filename):
+    """根据文件名判断是否为Excel名单"""
+    return os.path.splitext(str(filename))[1].lower() in EXCEL_EXTENSIONS
+
+
+def _is_xls(filename):
+    return os.path.splitext(str(filename))[1].lower() == '.xls'
+
+
+def _file_name(excel_file):
+    return getattr(excel_file, 'name', excel_file)
+
+
+def cell_text(value):
+    """把单元格的值转为与导出CSV一致的文本（日期为 YYYY-MM-DD，整数不带 .0）"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        if value.time() == time(0, 0):
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _column_names(header):
+    """表头与 pd.read_csv 一致：去掉首尾空格前的空列名为 Unnamed: i，重复列名加 .1、.2"""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = cell_text(value) or f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return pd.Index(names).str.strip()
+
+
+def _open_xlsx(excel_file):
+    from openpyxl import load_workbook
+
+    if hasattr(excel_file, 'seek'):
+        excel_file.seek(0)
+    return load_workbook(excel_file, read_only=True, data_only=True)
+
+
+def _open_xls(excel_file):
+    import xlrd
+
+    return xlrd.open_workbook(file_contents=read_file_bytes(excel_file), on_demand=True)
+
+
+def list_sheet_names(excel_file):
+    """工作表名称列表，供界面选择"""
+    if _is_xls(_file_name(excel_file)):
+        book = _open_xls(excel_file)
+        try:
+            return book.sheet_names()
+        finally:
+            book.release_resources()
+    workbook = _open_xlsx(excel_file)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def _iter_xlsx_rows(excel_file, sheet_name):
+    workbook = _open_xlsx(excel_file)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_rows(excel_file, sheet_name):
+    import xlrd
+
+    book = _open_xls(excel_file)
+    try:
+        sheet = book.sheet_by_name(sheet_name) if sheet_name else book.sheet_by_index(0)
+        for i in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(i):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    row.append(xlrd.xldate_as_datetime(cell.value, book.datemode))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                    row.append(None)
+                else:
+                    row.append(cell.value)
+            yield row
+    finally:
+        book.release_resources()
+
+
+def iter_excel_frames(excel_file, sheet_name=None, chunksize=2000):
+    """逐块产出名单 DataFrame：第一行为表头，值均为文本，行号在各块间连续"""
+    if _is_xls(_file_name(excel_file)):
+        rows = _iter_xls_rows(excel_file, sheet_name)
+    else:
+        rows = _iter_xlsx_rows(excel_file, sheet_name)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = _column_names(header)
+    width = len(columns)
+    start = 0
+    chunk = []
+    for values in rows:
+        texts = [cell_text(value) for value in values[:width]]
+        chunk.append(texts + [''] * (width - len(texts)))
+        if len(chunk) >= chunksize:
+            yield pd.DataFrame(chunk, columns=columns, index=pd.RangeIndex(start, start + len(chunk)), dtype=str)
+            start += len(chunk)
+            chunk = []
+    if chunk or start == 0:
+        yield pd.DataFrame(chunk, columns=columns, index=pd.RangeIndex(start, start + len(chunk)), dtype=str)
+
+
+def read_excel_roster(excel_file, sheet_name=None):
+    """整份读取Excel名单，结果与 read_roster 读取导出的CSV一致"""
+    return pd.concat(list(iter_excel_frames(excel_file, sheet_name)))
@@ -0,0 +1,214 @@
+"""只含 {{ 变量 }} 的模板的快速渲染
+
+docxtpl 每行都要预处理XML、执行 Jinja、解析并重新序列化整篇文档。模板里如果只有简单的
+变量占位符，可以先用特殊标记渲染一次，把每个部分切成「固定字节 + 变量」的片段；
+之后每行只需把处理好的值拼进去，不含变量的部分（样式、图片等）直接复用已压缩的条目。
+
+值的处理与 docxtpl + lxml 的结果逐字节一致：`{_{` 等转义还原、`>` 写为 `&gt;`、
+换行写为 <w:br/>、空文本节点写为自闭合标签。含 `&`、`<`、制表符等控制字符的值
+docxtpl 的处理方式依赖上下文（或会报错），这样的行仍走 docxtpl。
+构建时会用几组测试值同时走两条路径，结果有任何不同就不启用快速渲染。
+"""
+
+import io
+import re
+import struct
+import time
+import uuid
+import zipfile
+
+from .template import FIXED_ZIP_DATE_TIME
+
+# 简单占位符，以及去掉简单占位符后仍然存在的 Jinja 语法
+SIMPLE_PLACEHOLDER = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+JINJA_SYNTAX = re.compile(r'\{\{|\}\}|\{%|%\}|\{#|#\}')
+# 需要走 docxtpl 的值：& < 、除换行外的控制字符、XML不允许的字符
+UNSAFE_VALUE = re.compile('[\x00-\x09\x0b-\x1f&<\ud800-\udfff\ufffe\uffff]')
+EMPTY_TEXT = re.compile(rb'(<w:t(?: [^>]*)?)></w:t>')
+LINE_BREAK = '</w:t><w:br/><w:t xml:space="preserve">'
+# python-docx 对核心属性的长度限制
+CORE_PROPERTY_LIMIT = 255
+CORE_PROPERTIES = ['author', 'comments', 'identifier', 'language', 'subject', 'title']
+
+# 各部分的值处理方式：正文/页眉/页脚会被 lxml 重新解析，脚注直接写入，核心属性是纯文本
+REPARSED = 'reparsed'
+RAW = 'raw'
+CORE = 'core'
+
+
+def _part_kind(name):
+    if name == 'docProps/core.xml':
+        return CORE
+    if name == 'word/footnotes.xml':
+        return RAW
+    if name == 'word/document.xml' or re.fullmatch(r'word/(header|footer)\d*\.xml', name):
+        return REPARSED
+    return None
+
+
+def _unescape_braces(value):
+    return value.replace("{_{", "{{").replace("}_}", "}}").replace("{_%", "{%").replace("%_}", "%}")
+
+
+def _fill_value(value, kind):
+    if kind == CORE:
+        return value.replace('>', '&gt;')
+    value = _unescape_braces(value)
+    if kind == REPARSED:
+        value = value.replace('>', '&gt;')
+    return value.replace('\n', LINE_BREAK)
+
+
+def simple_variables(sources):
+    """所有 Jinja 源码都只含简单占位符时返回变量名集合，否则返回 None"""
+    names = set()
+    for source in sources:
+        if JINJA_SYNTAX.search(SIMPLE_PLACEHOLDER.sub('', source)):
+            return None
+        names.update(SIMPLE_PLACEHOLDER.findall(source))
+    return names
+
+
+def _zip_records(data):
+    """按中央目录顺序返回 (条目名, 本地记录字节, 中央目录记录字节)"""
+    end = data.rfind(b'PK\x05\x06')
+    count, directory_size, directory_offset = struct.unpack_from('<HII', data, end + 10)
+    entries = []
+    offset = directory_offset
+    for _ in range(count):
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', data, offset + 28)
+        header_offset, = struct.unpack_from('<I', data, offset + 42)
+        record_end = offset + 46 + name_length + extra_length + comment_length
+        name = data[offset + 46:offset + 46 + name_length].decode('utf-8')
+        entries.append((name, header_offset, bytes(data[offset:record_end])))
+        offset = record_end
+    starts = sorted(header_offset for _, header_offset, _ in entries) + [directory_offset]
+    next_start = dict(zip(starts, starts[1:]))
+    return [(name, bytes(data[start:next_start[start]]), central) for name, start, central in entries]
+
+
+class FastTemplate:
+    """由 CompiledTemplate 构建；render_bytes() 对不适用的行返回 None"""
+
+    def __init__(self, compiled, names):
+        self.names = sorted(names)
+        token = uuid.uuid4().hex
+        marker = re.compile(rf'{token}(\d+)x'.encode())
+        marked = compiled.render_docxtpl_bytes({name: f'{token}{i}x' for i, name in enumerate(self.names)})
+        # 每个条目为 (条目名, 固定记录或 None, 处理方式, 片段)
+        self._entries = []
+        with zipfile.ZipFile(io.BytesIO(marked)) as package:
+            for name, local, central in _zip_records(marked):
+                content = package.read(name)
+                if token.encode() not in content:
+                    self._entries.append((name, (local, central), None, None))
+                    continue
+                kind = _part_kind(name)
+                if kind is None:
+                    raise ValueError(f"placeholder in unsupported part {name}")
+                # 偶数位置是固定字节，奇数位置是变量序号
+                pieces = marker.split(content)
+                segments = [piece if i % 2 == 0 else int(piece) for i, piece in enumerate(pieces)]
+                self._entries.append((name, None, kind, segments))
+        self._core_properties = []
+        for prop in CORE_PROPERTIES:
+            initial = getattr(compiled._pristine.core_properties, prop) or ''
+            pieces = SIMPLE_PLACEHOLDER.split(initial)
+            if len(pieces) > 1:
+                self._core_properties.append(pieces)
+
+    def _values(self, context):
+        values = []
+        for name in self.names:
+            # 与 Jinja 一致：缺少的变量为空，其他值按 str() 输出
+            value = str(context[name]) if name in context else ''
+            if UNSAFE_VALUE.search(value):
+                return None
+            values.append(value)
+        by_name = dict(zip(self.names, values))
+        for pieces in self._core_properties:
+            length = sum(len(piece) if i % 2 == 0 else len(by_name.get(piece, '')) for i, piece in enumerate(pieces))
+            if length > CORE_PROPERTY_LIMIT:
+                return None
+        return values
+
+    def _record(self, name, data):
+        buffer = io.BytesIO()
+        info = zipfile.ZipInfo(name, FIXED_ZIP_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o600 << 16
+        with zipfile.ZipFile(buffer, 'w') as package:
+            package.writestr(info, data)
+        (_, local, central), = _zip_records(buffer.getvalue())
+        return local, central
+
+    def render_bytes(self, context, timings=None):
+        start = time.perf_counter()
+        values = self._values(context)
+        if values is None:
+            return None
+        encoded = {}
+        filled = {}
+        for name, static, kind, segments in self._entries:
+            if static is not None:
+                continue
+            parts = []
+            for i, segment in enumerate(segments):
+                if i % 2 == 0:
+                    parts.append(segment)
+                    continue
+                key = (segment, kind)
+                if key not in encoded:
+                    encoded[key] = _fill_value(values[segment], kind).encode('utf-8')
+                parts.append(encoded[key])
+            data = b''.join(parts)
+            if kind == REPARSED:
+                data = EMPTY_TEXT.sub(rb'\1/>', data)
+            filled[name] = data
+        rendered = time.perf_counter()
+        output = bytearray()
+        directory = []
+        for name, static, _, _ in self._entries:
+            local, central = static if static is not None else self._record(name, filled[name])
+            central = bytearray(central)
+            struct.pack_into('<I', central, 42, len(output))
+            output += local
+            directory.append(central)
+        directory_offset = len(output)
+        for central in directory:
+            output += central
+        output += struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(directory), len(directory),
+                              len(output) - directory_offset, directory_offset, 0)
+        if timings is not None:
+            timings['render'] = rendered - start
+            timings['save'] = time.perf_counter() - rendered
+        return bytes(output)
+
+
+def probe_contexts(names):
+    """构建时用来比对两条路径的测试值：空值、需要转义和换行的值、普通值"""
+    tricky = 'a > b "q" \'s\' {_{ x }_} 中文\n第二行\n'
+    return [
+        {name: '' for name in names},
+        {name: f'{tricky}{name}' for name in names},
+        {name: f'value {i}' for i, name in enumerate(names)},
+    ]
+
+
+def build_fast_template(compiled):
+    """模板只含简单占位符、且测试值的两条路径结果一致时返回 FastTemplate，否则返回 None"""
+    names = simple_variables(compiled.jinja_sources())
+    if not names:
+        return None
+    try:
+        fast = FastTemplate(compiled, names)
+    except ValueError:
+        return None
+    for probe in probe_contexts(fast.names):
+        try:
+            expected = compiled.render_docxtpl_bytes(probe)
+        except Exception:
+            return None
+        if fast.render_bytes(probe) != expected:
+            return None
+    return fast
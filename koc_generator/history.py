@@ -0,0 +1,210 @@
+"""合同历史：把每次生成的合同记录到本地 SQLite，按邮箱、姓名、平台账号、合同月份查询
+
+压缩包下载后，生成过哪些合同只存在于压缩包里；开启历史记录后，每份写入压缩包的合同
+都记下它的 context、模板哈希、文件名和内容哈希，可选地保存 .docx 本身，之后不用
+重新渲染就能取回。查询的四个字段都有索引（平台账号每个一行单独建索引），
+几十万份合同中按条件查找只需几毫秒。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from .cache import template_digest
+
+# 默认的历史数据库位置（跨会话保留，不放在临时目录）
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.koc_generator', 'history.sqlite3')
+DEFAULT_QUERY_LIMIT = 100
+# 查询结果的列（不含 context）；platform_username 为合同中的平台账号文本，按账号查询用 handles 表
+RESULT_COLUMNS = ['id', 'batch', 'created_at', 'filename', 'name', 'email', 'platform_username', 'month', 'template_hash', 'content_hash']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contracts (
+    id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    name TEXT COLLATE NOCASE,
+    email TEXT COLLATE NOCASE,
+    platform_username TEXT,
+    month TEXT,
+    template_hash TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    context TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contracts_email ON contracts (email);
+CREATE INDEX IF NOT EXISTS contracts_name ON contracts (name);
+CREATE INDEX IF NOT EXISTS contracts_month ON contracts (month);
+CREATE INDEX IF NOT EXISTS contracts_batch ON contracts (batch);
+CREATE INDEX IF NOT EXISTS contracts_content_hash ON contracts (content_hash);
+CREATE TABLE IF NOT EXISTS handles (
+    contract_id INTEGER NOT NULL REFERENCES contracts (id),
+    handle TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS handles_handle ON handles (handle);
+CREATE TABLE IF NOT EXISTS documents (
+    content_hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+'''
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_handle(handle):
+    """平台账号去掉首尾空格和开头的 @"""
+    return str(handle).strip().lstrip('@')
+
+
+class ContractHistory:
+    """合同历史数据库
+
+    用法与 Checkpoint 相同：generate_archive 在 recording() 中生成（开始时分配批次号），
+    每个模板 start()，每份合同 record()，每批结束 sync() 一次性写入并提交；
+    生成失败或重新生成时 discard() 删除本批次已写入的记录，没有交付的合同不会留在历史中。
+    store_documents 为 True 时同时保存 .docx 字节（按内容哈希去重）。
+
+    begin/start/record 保存的是一次生成的状态，每个生成任务使用自己的实例；
+    多个实例可以同时打开同一个数据库（WAL 模式，写入时串行）。
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, store_documents=False):
+        self.path = path
+        self.store_documents = store_documents
+        self.batch = None
+        self.digest = None
+        self._pending = []
+        self._documents = {}
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM contracts').fetchone()[0]
+
+    def begin(self):
+        """开始一次生成，返回批次号（时间 + 随机后缀）"""
+        self.batch = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        return self.batch
+
+    @contextmanager
+    def recording(self):
+        """一次生成：开始时分配批次号，正常结束时提交，出错时删除本批次已写入的记录"""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.discard()
+            raise
+        self.sync()
+
+    def discard(self):
+        """放弃本次生成：丢弃未写入的记录，删除本批次已提交的合同及只属于它们的 .docx"""
+        self._pending = []
+        self._documents = {}
+        if self.batch is None:
+            return
+        with self._lock, self._db:
+            hashes = [(row[0],) for row in self._db.execute('SELECT DISTINCT content_hash FROM contracts WHERE batch = ?', (self.batch,))]
+            self._db.execute('DELETE FROM handles WHERE contract_id IN (SELECT id FROM contracts WHERE batch = ?)', (self.batch,))
+            self._db.execute('DELETE FROM contracts WHERE batch = ?', (self.batch,))
+            self._db.executemany(
+                'DELETE FROM documents WHERE content_hash = ?1 AND NOT EXISTS (SELECT 1 FROM contracts WHERE content_hash = ?1)',
+                hashes,
+            )
+
+    def start(self, template):
+        """绑定接下来的合同所用的模板"""
+        self.digest = template_digest(template.template_bytes)
+
+    def record(self, filename, fields, context, data):
+        """记下一份合同；fields 为 name/email/platform_username/handles/month（见 derive_jobs 的 history_fields）"""
+        digest = content_hash(data)
+        row = (
+            self.batch, datetime.now().isoformat(timespec='seconds'), filename,
+            fields.get('name'), fields.get('email'), fields.get('platform_username'), fields.get('month'),
+            self.digest, digest, json.dumps(context, ensure_ascii=False, default=str),
+        )
+        self._pending.append((row, [normalize_handle(handle) for handle in fields.get('handles', ())]))
+        if self.store_documents:
+            self._documents[digest] = data
+
+    def sync(self):
+        """写入本批记下的合同并提交"""
+        if not self._pending and not self._documents:
+            return
+        with self._lock, self._db:
+            handles = []
+            for row, row_handles in self._pending:
+                contract_id = self._db.execute(
+                    'INSERT INTO contracts (batch, created_at, filename, name, email, platform_username, month, '
+                    'template_hash, content_hash, context) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    row,
+                ).lastrowid
+                handles.extend((contract_id, handle) for handle in row_handles if handle)
+            self._db.executemany('INSERT INTO handles (contract_id, handle) VALUES (?, ?)', handles)
+            self._db.executemany('INSERT OR IGNORE INTO documents (content_hash, data) VALUES (?, ?)', self._documents.items())
+        self._pending = []
+        self._documents = {}
+
+    def search(self, email=None, name=None, username=None, month=None, batch=None, limit=DEFAULT_QUERY_LIMIT):
+        """按条件查找（条件之间为“且”）；返回字典列表，最新的在前，has_document 表示是否保存了 .docx
+
+        邮箱、平台账号精确匹配，姓名按前缀匹配，均不区分大小写；平台账号可以带或不带 @，
+        匹配该合同的任一平台。
+        """
+        clauses, params = [], []
+        for column, value in (('email', email), ('month', month), ('batch', batch)):
+            if value:
+                clauses.append(f'c.{column} = ?')
+                params.append(value.strip())
+        if username:
+            clauses.append('c.id IN (SELECT contract_id FROM handles WHERE handle = ?)')
+            params.append(normalize_handle(username))
+        if name:
+            clauses.append("c.name LIKE ? ESCAPE '\\'")
+            params.append(name.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        columns = ', '.join(f'c.{column}' for column in RESULT_COLUMNS)
+        query = (f'SELECT {columns}, d.content_hash IS NOT NULL FROM contracts c '
+                 f'LEFT JOIN documents d ON d.content_hash = c.content_hash {where} ORDER BY c.id DESC LIMIT ?')
+        with self._lock:
+            rows = self._db.execute(query, params + [limit]).fetchall()
+        return [dict(zip(RESULT_COLUMNS + ['has_document'], row[:-1] + (bool(row[-1]),))) for row in rows]
+
+    def context(self, contract_id):
+        """一份合同渲染时的 context"""
+        with self._lock:
+            row = self._db.execute('SELECT context FROM contracts WHERE id = ?', (contract_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def document(self, contract_id):
+        """返回 (文件名, .docx 字节)；没有保存文档时为 None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT c.filename, d.data FROM contracts c JOIN documents d ON d.content_hash = c.content_hash WHERE c.id = ?',
+                (contract_id,),
+            ).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._db.close()
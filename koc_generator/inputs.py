@@ -0,0 +1,143 @@
+"""按上传内容哈希缓存解析结果：名单 DataFrame、编译好的模板及其变量
+
+Streamlit 每次重新运行都会重新读取上传的文件；同一份名单、同一个模板再次生成时，
+直接从这里取解析好的结果，跳过 CSV/Excel 读取和模板解析。缓存在进程内共享，
+按估算的内存大小淘汰最久未使用的条目。
+"""
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 默认容量（字节）
+DEFAULT_INPUT_CACHE_BYTES = 256 * 1024 * 1024
+# 解析后的模板（lxml 树、编译好的 Jinja 模板）约为 .docx 文件大小的倍数，用于估算占用
+TEMPLATE_SIZE_FACTOR = 20
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_file_bytes(source):
+    """读取文件（路径、上传文件或字节）的全部内容；上传文件读完后回到开头"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+        return data
+    with open(source, 'rb') as fh:
+        return fh.read()
+
+
+class InputCache:
+    """线程安全的解析结果缓存
+
+    roster() 返回名单 DataFrame 的浅拷贝（pandas 写时复制，各任务互不影响）。
+    模板在渲染时会修改自身状态，不能被两个任务同时使用：template() 借出一个空闲的
+    实例，用完后放回；没有空闲实例时重新编译一个。hits/misses 统计两类查询的命中情况。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_INPUT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def _store(self, key, value, size):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._entries and self.size() > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            del self._sizes[key]
+
+    def size(self):
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def roster(self, data, name, sheet_name=None):
+        """解析名单（CSV或Excel，按文件名判断），同样的内容和工作表只解析一次"""
+        key = ('roster', content_digest(data), name.lower().endswith(('.xlsx', '.xls')), sheet_name)
+        df = self._lookup(key)
+        if df is None:
+            from .engine import read_roster
+
+            roster = io.BytesIO(data)
+            roster.name = name
+            df = read_roster(roster, sheet_name)
+            self._store(key, df, int(df.memory_usage(index=True, deep=True).sum()))
+        return df.copy(deep=False)
+
+    def sheet_names(self, data, name):
+        """Excel名单的工作表名称"""
+        key = ('sheets', content_digest(data))
+        names = self._lookup(key)
+        if names is None:
+            from .excel import list_sheet_names
+
+            roster = io.BytesIO(data)
+            roster.name = name
+            names = list_sheet_names(roster)
+            self._store(key, names, sum(len(sheet) for sheet in names))
+        return list(names)
+
+    def variables(self, data, fast_path=False):
+        """模板中未声明（需要由 context 提供）的变量名"""
+        with self.template(data, fast_path) as template:
+            return template.undeclared_variables()
+
+    @contextmanager
+    def template(self, data, fast_path=False):
+        """借出编译好的模板，with 块结束后放回缓存"""
+        key = ('template', content_digest(data), fast_path)
+        template = None
+        with self._lock:
+            idle = self._entries.get(key)
+            if idle:
+                self._entries.move_to_end(key)
+                template = idle.pop()
+                self._sizes[key] -= len(data) * TEMPLATE_SIZE_FACTOR
+                self.hits += 1
+            else:
+                self.misses += 1
+        if template is None:
+            from .template import CompiledTemplate
+
+            template = CompiledTemplate(data, fast_path)
+            template.undeclared_variables()
+        try:
+            yield template
+        finally:
+            with self._lock:
+                idle = self._entries.setdefault(key, [])
+                self._entries.move_to_end(key)
+                idle.append(template)
+                self._sizes[key] = self._sizes.get(key, 0) + len(data) * TEMPLATE_SIZE_FACTOR
+                self._evict()
@@ -0,0 +1,172 @@
+"""后台生成任务：提交后立即返回任务ID，生成在线程池中进行，完成的压缩包保存在磁盘上
+
+Streamlit 每次重新运行脚本都会丢弃正在进行的同步生成；任务放到进程级的线程池后，
+页面可以随时刷新，其他会话凭任务ID也能查看进度和下载结果。
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .report import RunReport
+
+logger = logging.getLogger(__name__)
+
+# 任务目录、同时运行的任务数、完成的任务保留时间（秒）
+DEFAULT_JOB_DIR = os.path.join(tempfile.gettempdir(), 'koc_generator_jobs')
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_RETENTION = 24 * 3600
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUS_NAMES = {QUEUED: '排队中', RUNNING: '生成中', DONE: '已完成', FAILED: '失败'}
+
+
+class Job:
+    """一个生成任务的状态；完成或失败后同时写入磁盘，进程重启后仍可按ID查询"""
+
+    def __init__(self, job_id, title, download_filename, workers=1):
+        self.id = job_id
+        self.title = title
+        self.download_filename = download_filename
+        self.status = QUEUED
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self.progress = None
+        self.error = None
+        self.contracts = 0
+        self.summaries = 0
+        self.report = RunReport(workers)
+        self.archive_path = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'download_filename': self.download_filename,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'contracts': self.contracts,
+            'summaries': self.summaries,
+            'report': self.report.to_dict() if isinstance(self.report, RunReport) else self.report,
+            'archive_path': self.archive_path,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['id'], data['title'], data['download_filename'])
+        for key in ['status', 'created_at', 'finished_at', 'error', 'contracts', 'summaries', 'report', 'archive_path']:
+            setattr(job, key, data[key])
+        return job
+
+
+class JobManager:
+    """进程内共享的任务池
+
+    submit(run, ...) 中的 run(report=..., on_progress=...) 执行实际生成，返回
+    (压缩包文件对象, summaries, contract_files)，与 process_data 等函数相同。
+    """
+
+    def __init__(self, directory=DEFAULT_JOB_DIR, max_workers=DEFAULT_JOB_WORKERS, retention=DEFAULT_JOB_RETENTION):
+        self.directory = directory
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='koc-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.directory, job_id + suffix)
+
+    def submit(self, run, title, download_filename, workers=1):
+        """提交任务，立即返回任务ID"""
+        self.cleanup()
+        job = Job(uuid.uuid4().hex[:12], title, download_filename, workers)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, run)
+        return job.id
+
+    def _run(self, job, run):
+        job.status = RUNNING
+
+        def on_progress(progress):
+            job.progress = progress
+
+        try:
+            archive, summaries, contract_files = run(report=job.report, on_progress=on_progress)
+            archive_path = self._path(job.id, '.zip')
+            with archive, open(archive_path + '.tmp', 'wb') as fh:
+                shutil.copyfileobj(archive, fh)
+            os.replace(archive_path + '.tmp', archive_path)
+            job.archive_path = archive_path
+            job.contracts = len(contract_files)
+            job.summaries = len(summaries)
+            status = DONE
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.error = str(e)
+            status = FAILED
+        job.finished_at = datetime.now().isoformat(timespec='seconds')
+        job.report = job.report.to_dict()
+        # 状态最后设置：其他线程（轮询的页面、其他会话）看到已完成时，报告、结束时间和压缩包都已就绪
+        job.status = status
+        with open(self._path(job.id, '.json'), 'w', encoding='utf-8') as fh:
+            json.dump(job.to_dict(), fh, ensure_ascii=False)
+
+    def get(self, job_id):
+        """按ID查询任务；不在本进程内存中时从磁盘读取已完成的任务，找不到时返回 None"""
+        job_id = job_id.strip()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # 只接受本模块生成的ID格式，避免拼出任意路径
+        if not (len(job_id) == 12 and all(c in '0123456789abcdef' for c in job_id)):
+            return None
+        try:
+            with open(self._path(job_id, '.json'), encoding='utf-8') as fh:
+                return Job.from_dict(json.load(fh))
+        except FileNotFoundError:
+            return None
+
+    def open_archive(self, job_id):
+        """以只读方式打开已完成任务的压缩包"""
+        job = self.get(job_id)
+        if job is None or job.status != DONE:
+            raise KeyError(job_id)
+        return open(job.archive_path, 'rb')
+
+    def cleanup(self):
+        """删除超过保留时间的已完成任务"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished and os.path.exists(self._path(job_id, '.json')) and os.path.getmtime(self._path(job_id, '.json')) < cutoff:
+                    del self._jobs[job_id]
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
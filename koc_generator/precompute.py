@@ -0,0 +1,53 @@
+"""表单模式的预渲染：记录添加后立即在后台渲染合同，生成时只需从渲染缓存组装压缩包
+
+预渲染与生成使用同样的 context 推导和同样的缓存键（模板哈希 + context），
+修改某条记录或更换模板只会让对应的缓存项失效，其余记录仍然命中。
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Precomputer:
+    """进程内共享的后台预渲染线程；pending 为已提交但尚未渲染完的记录数"""
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='koc-precompute')
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rendered = 0
+
+    def submit(self, records, template_data, render_cache, input_cache, fast_path=False):
+        """提交一批表单记录（字典列表），在后台渲染并写入 render_cache"""
+        records = [dict(record) for record in records]
+        if not records:
+            return
+        with self._lock:
+            self.pending += len(records)
+        self._executor.submit(self._run, records, template_data, render_cache, input_cache, fast_path)
+
+    def _run(self, records, template_data, render_cache, input_cache, fast_path):
+        from .engine import derive_jobs, records_to_frame
+        from .render import ContractRenderer
+
+        try:
+            with input_cache.template(template_data, fast_path) as template:
+                rows = records_to_frame(records)
+                jobs = derive_jobs(rows, [''] * len(records), True, False, template.undeclared_variables())
+                contexts = [job['context'] for job in jobs if 'error' not in job]
+                with ContractRenderer(template, 1, render_cache) as renderer:
+                    for _ in renderer.render(contexts):
+                        with self._lock:
+                            self.rendered += 1
+        except Exception:
+            # 预渲染失败不影响生成：生成时缓存未命中的行会重新渲染并报告错误
+            logger.exception("Precomputing %d form records failed", len(records))
+        finally:
+            with self._lock:
+                self.pending -= len(records)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,53 @@
+"""生成进度：按时间节流，把逐行的进度合并成少量回调"""
+
+import time
+
+# 两次进度回调之间的最短间隔（秒）
+DEFAULT_PROGRESS_INTERVAL = 0.25
+
+
+class ProgressTracker:
+    """逐行调用 advance()，最多每 interval 秒调用一次 callback，结束时再调用一次
+
+    callback 收到一个字典：done、total（流式读取时为 None）、errors、elapsed（秒）、
+    rows_per_s、eta（秒，total 未知时为 None）、finished。
+    """
+
+    def __init__(self, callback=None, total=None, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.callback = callback
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self._start = time.perf_counter()
+        self._last = None
+
+    def advance(self, rows=1, errors=0):
+        self.done += rows
+        self.errors += errors
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if self._last is None or now - self._last >= self.interval:
+            self._last = now
+            self.callback(self._snapshot(now))
+
+    def finish(self):
+        if self.callback is not None:
+            self.callback(self._snapshot(time.perf_counter(), finished=True))
+
+    def _snapshot(self, now, finished=False):
+        elapsed = now - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(0.0, (self.total - self.done) / rate)
+        return {
+            'done': self.done,
+            'total': self.total,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'rows_per_s': rate,
+            'eta': eta,
+            'finished': finished,
+        }
@@ -0,0 +1,96 @@
+"""表单模式的记录存储：按列保存在 session state 中，翻页和搜索只取出当前页的行
+
+只用标准库，表单模式的页面不需要加载 pandas。
+"""
+
+import bisect
+
+# 表单记录的字段（与 create_form_record 生成的字典一致，未选的平台为空字符串）
+FORM_COLUMNS = [
+    'Party B Name', 'Email', 'Contact', 'Address', 'Video Rate', 'Estimated Videos',
+    'Start date', 'end date', 'Payment method', 'Bonus', 'Main Platform nickname',
+    'Statement', 'No. of Posted Videos', 'Payment Info', 'TT', 'IG', 'YT', 'FB', 'kwai',
+    'platform_display',
+]
+# 搜索匹配的字段
+SEARCH_COLUMNS = ['Party B Name', 'Email', 'Main Platform nickname']
+# 列表中显示的字段及表头
+DISPLAY_COLUMNS = {
+    'Party B Name': '姓名',
+    'Main Platform nickname': '主平台昵称',
+    'Email': '邮箱',
+    'platform_display': '平台',
+    'Video Rate': '视频金额',
+    'Estimated Videos': '预计视频',
+}
+DEFAULT_PAGE_SIZE = 20
+
+
+class RecordStore:
+    """按列保存的表单记录，每条记录有一个不会复用的整数ID
+
+    添加是每列各追加一个值；页面重新运行时只按页取行，开销与记录总数无关。
+    version 在每次修改后递增，可用作表格组件的 key，修改后清空旧的选择。
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.columns = {column: [] for column in FORM_COLUMNS}
+        self.version = 0
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, record):
+        """添加一条记录（create_form_record 返回的字典），返回它的ID"""
+        record_id = self._next_id
+        self._next_id += 1
+        self.ids.append(record_id)
+        for column, values in self.columns.items():
+            values.append(str(record.get(column, '')))
+        self.version += 1
+        return record_id
+
+    def delete(self, record_ids):
+        """批量删除"""
+        record_ids = set(record_ids)
+        keep = [i for i, record_id in enumerate(self.ids) if record_id not in record_ids]
+        if len(keep) == len(self.ids):
+            return
+        self.ids = [self.ids[i] for i in keep]
+        self.columns = {column: [values[i] for i in keep] for column, values in self.columns.items()}
+        self.version += 1
+
+    def clear(self):
+        self.delete(list(self.ids))
+
+    def search(self, query=''):
+        """匹配 query 的行位置（不区分大小写，匹配姓名、邮箱、主平台昵称）；query 为空时为全部行"""
+        query = query.strip().lower()
+        if not query:
+            return range(len(self.ids))
+        fields = [self.columns[column] for column in SEARCH_COLUMNS]
+        return [i for i, values in enumerate(zip(*fields)) if any(query in value.lower() for value in values)]
+
+    def page(self, positions, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """取出 positions 中第 page 页（从1开始）的行，返回带 ID 列的显示用表格（{列名: 值列表}）"""
+        visible = positions[(page - 1) * page_size:page * page_size]
+        table = {'ID': [self.ids[i] for i in visible]}
+        for column, title in DISPLAY_COLUMNS.items():
+            values = self.columns[column]
+            table[title] = [values[i] for i in visible]
+        return table
+
+    @property
+    def last_id(self):
+        return self.ids[-1] if self.ids else 0
+
+    def records_after(self, record_id):
+        """ID 大于 record_id 的记录（ID 按添加顺序递增），用于只处理新添加的记录"""
+        start = bisect.bisect_right(self.ids, record_id)
+        return [{column: values[i] for column, values in self.columns.items()} for i in range(start, len(self.ids))]
+
+    def to_records(self):
+        """全部记录的字典列表（生成时使用）"""
+        return [dict(zip(FORM_COLUMNS, values)) for values in zip(*self.columns.values())]
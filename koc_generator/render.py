@@ -0,0 +1,144 @@
+"""合同渲染：单进程或多进程，结果按输入顺序返回"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import cache_key, template_digest
+
+# 每个工作进程持有一份已编译的模板
+_worker_template = None
+# forkserver 预先导入的模块（docxtpl、python-docx、Jinja2、lxml 都由它导入）
+WORKER_PRELOAD = ['koc_generator.template']
+
+
+def default_workers():
+    """默认并行进程数：CPU核数"""
+    return os.cpu_count() or 1
+
+
+def worker_context():
+    """工作进程的启动方式
+
+    支持 forkserver 的平台上，工作进程从已经导入了渲染依赖的 forkserver 进程 fork 出来，
+    不必每个进程重新导入；forkserver 本身是单线程的，不受 Streamlit 多线程的影响。
+    其他平台（Windows）使用 spawn。
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(WORKER_PRELOAD)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def prewarm_workers():
+    """提前启动 forkserver，在后台导入渲染依赖；之后第一次并行渲染不必等待导入
+
+    可以重复调用；当前进程本身不导入任何渲染依赖。平台不支持 forkserver 时返回 False。
+    """
+    if worker_context().get_start_method() != 'forkserver':
+        return False
+    from multiprocessing import forkserver
+    forkserver.ensure_running()
+    return True
+
+
+def _init_worker(template_bytes, fast_path):
+    from .template import CompiledTemplate
+
+    global _worker_template
+    _worker_template = CompiledTemplate(template_bytes, fast_path)
+
+
+def _render_one(template, context):
+    timings = {}
+    try:
+        return template.render_bytes(context, timings), None, timings
+    except Exception as e:
+        return None, str(e), timings
+
+
+def _render_in_worker(context):
+    return _render_one(_worker_template, context)
+
+
+class ContractRenderer:
+    """按顺序为每个 context 生成 (docx字节, 错误信息)
+
+    workers > 1 时在第一次需要时启动进程池，模板字节只在每个进程启动时传递一次；
+    同一个渲染器可以连续处理多批 context（例如分块读取的CSV）。
+    传入 cache（RenderCache）时只渲染缓存中没有的 context，新结果写回缓存。
+    render(..., timings=True) 时额外给出该行 render/save 的耗时（缓存命中的行为空字典）。
+    """
+
+    def __init__(self, template, workers=1, cache=None):
+        self.template = template
+        self.workers = workers
+        self.cache = cache
+        self._executor = None
+        self._digest = template_digest(template.template_bytes) if cache is not None and template is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # 不在 Streamlit 的多线程进程里直接 fork，见 worker_context
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=worker_context(),
+                initializer=_init_worker,
+                initargs=(self.template.template_bytes, self.template.fast_path),
+            )
+        return self._executor
+
+    def _render_all(self, contexts):
+        if self.workers <= 1 or len(contexts) < 2:
+            for context in contexts:
+                yield _render_one(self.template, context)
+            return
+        chunksize = max(1, min(32, len(contexts) // (self.workers * 4)))
+        yield from self._pool().map(_render_in_worker, contexts, chunksize=chunksize)
+
+    def render(self, contexts, timings=False):
+        results = self._render_cached(list(contexts))
+        if timings:
+            yield from results
+        else:
+            for data, error, _ in results:
+                yield data, error
+
+    def _render_cached(self, contexts):
+        if self.cache is None:
+            yield from self._render_all(contexts)
+            return
+        keys = [cache_key(self._digest, context) for context in contexts]
+        # 只记下哪些已缓存，文档字节在写入压缩包时才逐个读取，不会整批留在内存里
+        cached = [self.cache.contains(key) for key in keys]
+        rendered = self._render_all([context for context, hit in zip(contexts, cached) if not hit])
+        for key, context, hit in zip(keys, contexts, cached):
+            data = self.cache.get(key) if hit else None
+            if data is not None:
+                self.cache.hits += 1
+                yield data, None, {}
+                continue
+            self.cache.misses += 1
+            # 检查之后才被其他会话淘汰的文档在本进程补渲染
+            data, error, row_timings = next(rendered) if not hit else _render_one(self.template, context)
+            if error is None:
+                self.cache.put(key, data)
+            yield data, error, row_timings
+
+
+def render_contracts(template, contexts, workers=1, cache=None):
+    """一次性渲染一批 context，见 ContractRenderer"""
+    with ContractRenderer(template, workers, cache) as renderer:
+        yield from renderer.render(contexts)
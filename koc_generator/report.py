@@ -0,0 +1,165 @@
+"""运行报告：记录各阶段耗时、每行延迟的分位数和最慢的行，生成后展示并写入压缩包"""
+
+import heapq
+import json
+import math
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+# 报告中的阶段顺序与名称
+STAGES = ['parse', 'validate', 'derive', 'render', 'save', 'writestr']
+STAGE_NAMES = {
+    'parse': 'CSV解析',
+    'validate': '整表校验',
+    'derive': '推导context',
+    'render': 'template.render',
+    'save': 'template.save',
+    'writestr': 'zip_file.writestr',
+}
+# 逐行计时的阶段
+ROW_STAGES = ['render', 'save', 'writestr']
+SLOWEST_ROWS = 10
+
+
+def percentile(values, q):
+    """最近秩法的分位数，values 需已排序"""
+    if not values:
+        return None
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+def report_filename():
+    return f"Run_Report_{date.today().isoformat()}.json"
+
+
+class RunReport:
+    """一次生成的计时记录
+
+    stage() 计整段耗时（解析、推导按批计时），add_row() 记一行在 render/save/writestr
+    上的耗时，用于每行延迟的 p50/p95 和最慢的行。计时只是 perf_counter 相减，开销可以忽略。
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.reset()
+
+    def reset(self):
+        """清空已有的记录，重新开始计时"""
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self.elapsed = None
+        self.totals = {stage: 0.0 for stage in STAGES}
+        self.calls = {stage: 0 for stage in STAGES}
+        self.row_times = {stage: [] for stage in ROW_STAGES}
+        self._slowest = []
+        self._order = 0
+        self.rows = 0
+        self.error_rows = []
+        self.contracts = 0
+        self.summaries = 0
+        self.fast_path = False
+        self.resumed = None
+        self.templates = None
+        self.duplicate_rows = []
+        self.renamed = 0
+        self.cache_hits = None
+        self.cache_misses = None
+        self._cache = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.totals[name] += seconds
+        self.calls[name] += 1
+
+    def add_row(self, label, timings):
+        """记录一行各阶段的耗时（秒）；缓存命中的行没有 render/save"""
+        self.rows += 1
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+            self.row_times[name].append(seconds)
+        total = sum(timings.values())
+        self._order += 1
+        item = (total, -self._order, label, dict(timings))
+        if len(self._slowest) < SLOWEST_ROWS:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def track_cache(self, cache):
+        """记下渲染缓存当前的计数，finish() 时只统计本次运行的命中/未命中"""
+        if cache is not None:
+            self._cache = (cache, cache.hits, cache.misses)
+
+    def add_error(self, label, error):
+        self.error_rows.append({'label': label, 'error': str(error)})
+
+    @property
+    def errors(self):
+        return len(self.error_rows)
+
+    def finish(self, contracts=0, summaries=0):
+        self.elapsed = time.perf_counter() - self._start
+        self.contracts = contracts
+        self.summaries = summaries
+        if self._cache is not None:
+            cache, hits, misses = self._cache
+            self.cache_hits = cache.hits - hits
+            self.cache_misses = cache.misses - misses
+
+    def stage_rows(self):
+        """每个阶段一行：总耗时、调用次数、每行延迟的 p50/p95（毫秒）"""
+        rows = []
+        for name in STAGES:
+            times = sorted(self.row_times.get(name, []))
+            rows.append({
+                'stage': name,
+                'name': STAGE_NAMES[name],
+                'total_s': round(self.totals[name], 4),
+                'calls': self.calls[name],
+                'p50_ms': round(percentile(times, 50) * 1000, 2) if times else None,
+                'p95_ms': round(percentile(times, 95) * 1000, 2) if times else None,
+            })
+        return rows
+
+    def slowest_rows(self):
+        rows = []
+        for total, _, label, timings in sorted(self._slowest, reverse=True):
+            row = {'label': label, 'total_ms': round(total * 1000, 2)}
+            for name in ROW_STAGES:
+                row[f'{name}_ms'] = round(timings[name] * 1000, 2) if name in timings else None
+            rows.append(row)
+        return rows
+
+    def to_dict(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self._start
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'elapsed_s': round(elapsed, 4),
+            'rows': self.rows,
+            'rows_per_s': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            'contracts': self.contracts,
+            'summaries': self.summaries,
+            'errors': self.errors,
+            'error_rows': self.error_rows,
+            'workers': self.workers,
+            'fast_path': self.fast_path,
+            'resumed': self.resumed,
+            'templates': self.templates,
+            'duplicate_rows': self.duplicate_rows,
+            'renamed': self.renamed,
+            'cache': None if self.cache_hits is None else {'hits': self.cache_hits, 'misses': self.cache_misses},
+            'stages': self.stage_rows(),
+            'slowest_rows': self.slowest_rows(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
@@ -0,0 +1,123 @@
+"""按行选择模板：同一份名单中不同支付方式、奖励档位、履行状态的行使用不同的合同模板
+
+规则按顺序匹配行的字段，第一条匹配的规则决定该行的模板，都不匹配时使用默认模板。
+生成时每批按模板分组，每组用该模板渲染；编译好的模板及其渲染器保存在有上限的池中，
+同一个模板只解析一次。
+"""
+
+from collections import OrderedDict
+
+# 可用于选择模板的列及其显示名称
+ROUTE_COLUMNS = {
+    'Payment method': '支付方式',
+    'Bonus': '奖励机制',
+    'Statement': '履行状态',
+}
+# 同时保留的已编译模板（及其渲染器）个数
+DEFAULT_TEMPLATE_POOL_SIZE = 4
+
+
+class TemplateRouter:
+    """模板及选择规则
+
+    templates 为 {模板名: 模板}，模板可以是路径、字节、文件对象或 CompiledTemplate；
+    rules 为 (列名, 取值, 模板名) 的列表，取值比较时去掉首尾空格、不区分大小写；
+    default 为都不匹配时的模板名（默认第一个模板）。
+    """
+
+    def __init__(self, templates, rules=(), default=None, fast_path=False, max_templates=DEFAULT_TEMPLATE_POOL_SIZE):
+        self.templates = dict(templates)
+        if not self.templates:
+            raise ValueError("至少需要一个模板")
+        self.default = default if default is not None else next(iter(self.templates))
+        self.rules = [(column, str(value).strip().lower(), name) for column, value, name in rules]
+        missing = ({name for _, _, name in self.rules} | {self.default}) - set(self.templates)
+        if missing:
+            raise ValueError(f"规则中的模板不存在: {', '.join(sorted(missing))}")
+        self.fast_path = fast_path
+        self.max_templates = max_templates
+
+    @classmethod
+    def single(cls, template):
+        """只有一个模板、所有行都使用它"""
+        return cls({'': template})
+
+    def route(self, rows):
+        """每行的模板名"""
+        import numpy as np
+
+        names = np.full(len(rows), self.default, dtype=object)
+        matched = np.zeros(len(rows), dtype=bool)
+        for column, value, name in self.rules:
+            if column not in rows.columns:
+                continue
+            hit = ~matched & (rows[column].fillna('').astype(str).str.strip().str.lower() == value).to_numpy()
+            names[hit] = name
+            matched |= hit
+        return names
+
+    def split(self, rows, labels):
+        """按模板分组，返回 [(模板名, 行, 标签)]；组内保持原来的行顺序"""
+        import pandas as pd
+
+        names = self.route(rows)
+        groups = []
+        for name in pd.unique(names):
+            mask = names == name
+            groups.append((name, rows[mask], [label for label, keep in zip(labels, mask) if keep]))
+        return groups
+
+
+def as_router(template):
+    """generate_archive 的模板参数：已经是 TemplateRouter 时原样返回，否则为单模板"""
+    return template if isinstance(template, TemplateRouter) else TemplateRouter.single(template)
+
+
+class TemplatePool:
+    """按模板名保存编译好的模板和渲染器，超过 router.max_templates 时关闭最久未使用的
+
+    多进程渲染时每个渲染器有自己的进程池，上限同时限制了进程数。
+    compiled 为本次编译模板的次数。模板的变量在编译时记下，不随模板淘汰，
+    之后查询变量（known_variables）不需要重新编译。
+    """
+
+    def __init__(self, router, workers=1, render_cache=None):
+        self.router = router
+        self.workers = workers
+        self.render_cache = render_cache
+        self.compiled = 0
+        self._entries = OrderedDict()
+        self._variables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, name):
+        """返回 (CompiledTemplate, ContractRenderer)"""
+        if name in self._entries:
+            self._entries.move_to_end(name)
+            return self._entries[name]
+        from .render import ContractRenderer
+        from .template import compile_template
+
+        template = compile_template(self.router.templates[name], self.router.fast_path)
+        self.compiled += 1
+        self._variables[name] = template.undeclared_variables()
+        entry = (template, ContractRenderer(template, self.workers, self.render_cache))
+        self._entries[name] = entry
+        while len(self._entries) > max(1, self.router.max_templates):
+            _, (_, renderer) = self._entries.popitem(last=False)
+            renderer.close()
+        return entry
+
+    def known_variables(self, name):
+        """已编译过的模板的变量（模板无法分析时为 None）；还没编译过时抛出 KeyError"""
+        return self._variables[name]
+
+    def close(self):
+        for _, renderer in self._entries.values():
+            renderer.close()
+        self._entries.clear()
@@ -0,0 +1,111 @@
+"""概括导出：合并文件模式的文本和机器可读的汇总表，逐行写入临时文件
+
+合并的概括文本和汇总表都随行追加，内存中不保留整份内容；生成结束后
+通过 ArchiveWriter.write_stream 分块写入压缩包。
+"""
+
+import codecs
+import csv
+import io
+import json
+import tempfile
+from datetime import date
+
+# 汇总表的列（derive_jobs 在 summary_fields=True 时为每行给出这些字段）
+SUMMARY_FIELDS = [
+    'name', 'nickname', 'platforms', 'video_rate', 'video_number',
+    'promotion_date', 'status', 'posted_videos', 'bonus', 'payment_terms',
+]
+# 汇总表格式及扩展名
+TABLE_FORMATS = {'csv': 'csv', 'xlsx': 'xlsx', 'jsonl': 'jsonl'}
+# 临时文件超过该大小（字节）后写入磁盘
+DEFAULT_SUMMARY_SPOOL_BYTES = 16 * 1024 * 1024
+
+
+def combined_filename(today=None):
+    return f'All_Summaries_{today or date.today().isoformat()}.txt'
+
+
+def table_filename(table_format, today=None):
+    return f'Summary_Table_{today or date.today().isoformat()}.{TABLE_FORMATS[table_format]}'
+
+
+class SummaryExporter:
+    """收集概括并在结束时写入压缩包
+
+    combined 为 True 时写出 All_Summaries_<日期>.txt（内容与原来的合并文件相同）；
+    table_format 为 'csv' / 'xlsx' / 'jsonl' 时另写一张每行一条概括的汇总表。
+    CSV 带 BOM，便于 Excel 直接打开中文内容。
+    """
+
+    def __init__(self, combined=False, table_format=None, spool_bytes=DEFAULT_SUMMARY_SPOOL_BYTES):
+        if table_format is not None and table_format not in TABLE_FORMATS:
+            raise ValueError(f"不支持的汇总表格式: {table_format}")
+        self.combined = combined
+        self.table_format = table_format
+        self.count = 0
+        self._text = tempfile.SpooledTemporaryFile(spool_bytes) if combined else None
+        self._table = None
+        self._csv_buffer = None
+        self._sheet = None
+        if table_format == 'xlsx':
+            # write_only 工作簿逐行写出 XML，不在内存中保留单元格
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet('Summaries')
+            self._sheet.append(SUMMARY_FIELDS)
+        elif table_format is not None:
+            self._table = tempfile.SpooledTemporaryFile(spool_bytes)
+            if table_format == 'csv':
+                self._csv_buffer = io.StringIO()
+                self._csv_writer = csv.writer(self._csv_buffer)
+                self._table.write(codecs.BOM_UTF8)
+                self._write_csv_row(SUMMARY_FIELDS)
+
+    @property
+    def wants_fields(self):
+        """是否需要 derive_jobs 给出汇总表字段"""
+        return self.table_format is not None
+
+    def add(self, name, summary, fields=None):
+        """追加一条概括；fields 为汇总表的一行（SUMMARY_FIELDS 的字典）"""
+        self.count += 1
+        if self._text is not None:
+            self._text.write(f"=== {name} ===\n{summary}\n\n".encode('utf-8'))
+        if self.table_format is None:
+            return
+        fields = fields or {'name': name}
+        if self._sheet is not None:
+            self._sheet.append([fields.get(field, '') for field in SUMMARY_FIELDS])
+        elif self._csv_buffer is not None:
+            self._write_csv_row([fields.get(field, '') for field in SUMMARY_FIELDS])
+        else:
+            row = {field: fields.get(field, '') for field in SUMMARY_FIELDS}
+            self._table.write((json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def _write_csv_row(self, values):
+        self._csv_writer.writerow(values)
+        self._table.write(self._csv_buffer.getvalue().encode('utf-8'))
+        self._csv_buffer.seek(0)
+        self._csv_buffer.truncate()
+
+    def write_to(self, zip_file, today=None):
+        """把合并文本和汇总表写入 zip_file（ArchiveWriter）；没有概括时不写"""
+        try:
+            if not self.count:
+                return
+            if self._text is not None:
+                zip_file.write_stream(combined_filename(today), self._text)
+            if self.table_format == 'xlsx':
+                with tempfile.SpooledTemporaryFile(DEFAULT_SUMMARY_SPOOL_BYTES) as workbook_file:
+                    self._workbook.save(workbook_file)
+                    zip_file.write_stream(table_filename('xlsx', today), workbook_file)
+            elif self._table is not None:
+                zip_file.write_stream(table_filename(self.table_format, today), self._table)
+        finally:
+            self.close()
+
+    def close(self):
+        for spool in (self._text, self._table):
+            if spool is not None:
+                spool.close()
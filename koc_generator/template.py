@@ -0,0 +1,183 @@
+"""编译后的Word模板：每个批次只解析一次 .docx 与 Jinja 源码"""
+
+import copy
+import io
+import re
+import struct
+import time
+
+from docx import Document
+from docxtpl import DocxTemplate
+from jinja2 import Environment, Template, meta
+from jinja2.exceptions import TemplateError
+
+from .inputs import read_file_bytes as read_template_bytes
+
+# .docx 内各部分的修改时间统一写为 1980-01-01 00:00（ZIP能表示的最早时间，DOS日期/时间格式）
+FIXED_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+FIXED_ZIP_DATE = (0 << 9) | (1 << 5) | 1
+FIXED_ZIP_TIME = 0
+
+
+def fix_zip_timestamps(data):
+    """把ZIP中每个条目的修改时间改为固定值，相同内容的文档得到相同字节
+
+    python-docx 保存时按当前时间写入条目时间；这里直接改写本地文件头和中央目录中的
+    时间字段（不在CRC校验范围内），不需要重新压缩。
+    """
+    data = bytearray(data)
+    end = data.rfind(b'PK\x05\x06')
+    if end < 0:
+        return bytes(data)
+    count, _, offset = struct.unpack_from('<HII', data, end + 10)
+    for _ in range(count):
+        name_length, extra_length, comment_length = struct.unpack_from('<HHH', data, offset + 28)
+        header_offset, = struct.unpack_from('<I', data, offset + 42)
+        struct.pack_into('<HH', data, offset + 12, FIXED_ZIP_TIME, FIXED_ZIP_DATE)
+        struct.pack_into('<HH', data, header_offset + 10, FIXED_ZIP_TIME, FIXED_ZIP_DATE)
+        offset += 46 + name_length + extra_length + comment_length
+    return bytes(data)
+
+
+def compile_template(template_file, fast_path=False):
+    """返回已编译的模板；传入的已经是 CompiledTemplate 时直接复用"""
+    if isinstance(template_file, CompiledTemplate):
+        return template_file
+    return CompiledTemplate(template_file, fast_path)
+
+
+class CompiledTemplate(DocxTemplate):
+    """只解析一次的 DocxTemplate
+
+    模板字节、document XML 和各部分（正文、页眉、页脚、脚注）预处理后的 Jinja 模板
+    只在第一次使用时构建；每次 render() 都从原始文档的干净副本开始，
+    输出与每行重新 DocxTemplate(...) 完全一致。
+
+    fast_path=True 时，如果模板只含简单的 {{ 变量 }}，render_bytes() 改用
+    fastpath.FastTemplate 直接拼接XML（输出相同），其他模板和不适用的行仍走 docxtpl。
+    """
+
+    def __init__(self, template_file, fast_path=False):
+        self.template_bytes = read_template_bytes(template_file)
+        super().__init__(io.BytesIO(self.template_bytes))
+        self._pristine = Document(io.BytesIO(self.template_bytes))
+        self._sources = {}
+        self._compiled = {}
+        self._variables = None
+        self._introspected = False
+        self.fast_path = fast_path
+        self.fast = None
+        if fast_path:
+            from .fastpath import build_fast_template
+            self.fast = build_fast_template(self)
+
+    def init_docx(self, reload=True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = copy.deepcopy(self._pristine)
+            self.is_rendered = False
+
+    def save(self, filename, *args, **kwargs):
+        if not self.is_saved and not self.is_rendered:
+            self.docx = copy.deepcopy(self._pristine)
+        self.pre_processing()
+        self.docx.save(filename, *args, **kwargs)
+        self.post_processing(filename)
+        self.is_saved = True
+
+    def _patched_source(self, part, build):
+        # 每次渲染都从原始文档开始，同一部分的预处理结果可以复用
+        key = str(part.partname)
+        if key not in self._sources:
+            self._sources[key] = build()
+        return self._sources[key]
+
+    def build_xml(self, context, jinja_env=None):
+        part = self.docx._part
+        xml = self._patched_source(part, lambda: self.patch_xml(self.get_xml()))
+        return self.render_xml_part(xml, part, context, jinja_env)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for relKey, part in self.get_headers_footers(uri):
+            xml = self._patched_source(part, lambda: self.patch_xml(self.get_part_xml(part)))
+            encoding = self.get_headers_footers_encoding(xml)
+            xml = self.render_xml_part(xml, part, context, jinja_env)
+            yield relKey, xml.encode(encoding)
+
+    def render_xml_part(self, src_xml, part, context, jinja_env=None):
+        key = (str(part.partname), id(jinja_env))
+        try:
+            self.current_rendering_part = part
+            template = self._compiled.get(key)
+            if template is None:
+                src = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+                template = jinja_env.from_string(src) if jinja_env else Template(src)
+                self._compiled[key] = template
+            dst_xml = template.render(context)
+        except TemplateError as exc:
+            if hasattr(exc, "lineno") and exc.lineno is not None:
+                line_number = max(exc.lineno - 4, 0)
+                src_lines = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml).splitlines()
+                exc.docx_context = [re.sub(r"<[^>]+>", "", x) for x in src_lines[line_number:line_number + 7]]
+            raise exc
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
+
+    def jinja_sources(self):
+        """预处理后交给 Jinja 的全部源码：正文、页眉页脚、脚注和核心属性"""
+        self.init_docx()
+        part = self.docx._part
+        sources = [self._patched_source(part, lambda: self.patch_xml(self.get_xml()))]
+        for uri in (self.HEADER_URI, self.FOOTER_URI):
+            for _, part in self.get_headers_footers(uri):
+                sources.append(self._patched_source(part, lambda: self.patch_xml(self.get_part_xml(part))))
+        for part in self.docx.part.package.parts:
+            if part.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml":
+                blob = part.blob.decode("utf-8") if isinstance(part.blob, bytes) else part.blob
+                sources.append(self.patch_xml(blob))
+        properties = self.docx.core_properties
+        sources.extend(getattr(properties, name) or '' for name in ['author', 'comments', 'identifier', 'language', 'subject', 'title'])
+        return sources
+
+    def undeclared_variables(self):
+        """模板需要由 context 提供的变量名（只分析一次）；模板语法有误时返回 None
+
+        与 docxtpl 的 get_undeclared_template_variables 不同，脚注和核心属性中的变量也包括在内。
+        """
+        if not self._introspected:
+            env = Environment()
+            try:
+                self._variables = frozenset().union(*(meta.find_undeclared_variables(env.parse(source)) for source in self.jinja_sources()))
+            except TemplateError:
+                self._variables = None
+            self._introspected = True
+        return self._variables
+
+    def render_docxtpl_bytes(self, context, timings=None):
+        """用 docxtpl 渲染一行并返回 .docx 字节"""
+        start = time.perf_counter()
+        self.render(context)
+        rendered = time.perf_counter()
+        doc_stream = io.BytesIO()
+        self.save(doc_stream)
+        data = fix_zip_timestamps(doc_stream.getbuffer())
+        if timings is not None:
+            timings['render'] = rendered - start
+            timings['save'] = time.perf_counter() - rendered
+        return data
+
+    def render_bytes(self, context, timings=None):
+        """渲染一行并返回 .docx 字节；相同的模板和 context 总是得到相同的字节
+
+        传入 timings 字典时写入 'render' 与 'save' 的耗时（秒）。
+        """
+        if self.fast is not None:
+            data = self.fast.render_bytes(context, timings)
+            if data is not None:
+                return data
+        return self.render_docxtpl_bytes(context, timings)
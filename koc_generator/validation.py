@@ -0,0 +1,99 @@
+"""名单的整表校验：按列一次检查所有行，在渲染任何合同之前给出完整的错误表"""
+
+import numpy as np
+import pandas as pd
+
+# 无效行的处理方式：跳过无效行继续生成，或在渲染前停止
+SKIP_INVALID = 'skip'
+STOP_INVALID = 'stop'
+
+# 必填列及其在错误表中的名称（与表单校验的必填项一致）
+REQUIRED_FIELDS = {
+    'Party B Name': '乙方姓名',
+    'Email': '邮箱地址',
+    'Video Rate': '视频金额',
+    'Estimated Videos': '预计视频数量',
+    'Start date': '开始日期',
+    'Payment method': '支付方式',
+}
+EMAIL_PATTERN = r"[^@]+@[^@]+\.[^@]+"
+DATE_FORMAT = '%Y-%m-%d'
+FINISHED_STATEMENT = "已履行完毕"
+ERROR_COLUMNS = ['row', 'label', 'column', 'error']
+
+
+class InvalidRowsError(ValueError):
+    """名单中有未通过校验的行（选择了停止生成）；errors 为完整的错误表"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"名单中有 {errors['row'].nunique()} 行未通过校验，已停止生成")
+
+
+def _column(rows, column):
+    """去掉首尾空格的文本列；列不存在时为空字符串"""
+    if column not in rows.columns:
+        return pd.Series('', index=rows.index, dtype=object)
+    return rows[column].fillna('').astype(str).str.strip()
+
+
+def _parse_distinct(values, parse):
+    """每个不同的值只解析一次（金额、日期的取值通常很少）"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    parsed = parse(pd.Series(uniques, dtype=object))
+    return pd.Series(parsed.to_numpy()[codes], index=values.index)
+
+
+def _numbers(values):
+    return _parse_distinct(values.where(values != ''), lambda distinct: pd.to_numeric(distinct, errors='coerce'))
+
+
+def _dates(values):
+    return _parse_distinct(values.where(values != ''), lambda distinct: pd.to_datetime(distinct, format=DATE_FORMAT, errors='coerce'))
+
+
+def validate_rows(rows, labels):
+    """校验 select_roster_rows 选出的行，返回错误表（每个问题一行，按行顺序）
+
+    错误表的列：row（名单中的行号）、label（与生成时的错误提示相同）、column、error。
+    """
+    checks = []
+    values = {column: _column(rows, column) for column in list(REQUIRED_FIELDS) + ['end date', 'Statement', 'No. of Posted Videos']}
+    for column, name in REQUIRED_FIELDS.items():
+        checks.append((column, values[column] == '', f"{name}为必填项"))
+
+    email = values['Email']
+    checks.append(('Email', (email != '') & ~email.str.match(EMAIL_PATTERN), "邮箱格式不正确"))
+
+    rate = values['Video Rate']
+    numeric_rate = _numbers(rate)
+    checks.append(('Video Rate', (rate != '') & numeric_rate.isna(), "视频金额不是数字"))
+    checks.append(('Video Rate', numeric_rate <= 0, "视频金额必须大于0"))
+
+    start, end = values['Start date'], values['end date']
+    start_dates, end_dates = _dates(start), _dates(end)
+    checks.append(('Start date', (start != '') & start_dates.isna(), "开始日期无法解析（应为 YYYY-MM-DD）"))
+    checks.append(('end date', (end != '') & end_dates.isna(), "结束日期无法解析（应为 YYYY-MM-DD）"))
+    checks.append(('end date', start_dates > end_dates, "开始日期不能晚于结束日期"))
+
+    finished = values['Statement'] == FINISHED_STATEMENT
+    checks.append(('No. of Posted Videos', finished & (values['No. of Posted Videos'] == ''), "已履行完毕状态下，实际上线视频数量为必填项"))
+
+    frames = []
+    for order, (column, mask, message) in enumerate(checks):
+        positions = np.flatnonzero(mask.to_numpy(dtype=bool))
+        if len(positions):
+            frames.append(pd.DataFrame({'position': positions, 'order': order, 'column': column, 'error': message}))
+    if not frames:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    table = pd.concat(frames, ignore_index=True).sort_values(['position', 'order'], kind='stable')
+    positions = table['position'].to_numpy()
+    table.insert(0, 'row', rows.index.to_numpy()[positions])
+    table.insert(1, 'label', np.asarray(labels, dtype=object)[positions])
+    return table[ERROR_COLUMNS].reset_index(drop=True)
+
+
+def drop_invalid_rows(rows, labels, errors):
+    """去掉错误表中出现的行，返回 (有效行, 有效行的标签)"""
+    valid = ~rows.index.isin(errors['row'])
+    return rows[valid], [label for label, keep in zip(labels, valid) if keep]